@@ -1,6 +1,7 @@
-from .ui import create_ui
-
-app = create_ui()
-
 if __name__ == "__main__":
+    # Imported here rather than at module level: spawned post-processing workers
+    # re-import this module as __mp_main__ and must not set up the database or UI
+    from .ui import create_ui
+
+    app = create_ui()
     app.launch(share=True)
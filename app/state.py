@@ -1,21 +1,65 @@
-from memory.database import init_db, SessionLocal
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+from memory.database import init_db, session_scope, engine
 from memory.repository import GenerationRepository
 from core.generator import GeneratorAgent
+from core.token_budget import TokenEstimator
 from core.refiner import RefinerAgent
+from llms.model_health import ModelHealthRegistry, set_health_registry
 
 class AppState:
+    """
+    Process-wide state shared by all UI sessions. Only stateless or
+    thread-safe objects live here; database sessions and refiners are
+    created per request so concurrent users never share mutable state.
+    """
     def __init__(self):
         # Initialize DB
         init_db()
-        self.db = SessionLocal()
-        self.repo = GenerationRepository(self.db)
         
+        # Model health is persisted through the same per-request sessions
+        self.health = ModelHealthRegistry(repository_factory=self.repository)
+        set_health_registry(self.health)
+
         # Agents
-        self.generator = GeneratorAgent()
-        self.refiner = RefinerAgent(self.generator)
+        self.generator = GeneratorAgent(token_estimator=TokenEstimator(repository_factory=self.repository))
+
+        # Cancellation flags for in-flight runs, keyed by UI session
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._cancel_lock = threading.Lock()
+
+    @contextmanager
+    def repository(self) -> Iterator[GenerationRepository]:
+        with session_scope() as db:
+            yield GenerationRepository(db)
+
+    def build_refiner(self, judge_model: str) -> RefinerAgent:
+        return RefinerAgent(self.generator, judge_model=judge_model)
         
+    def begin_run(self, session_id: str) -> threading.Event:
+        event = threading.Event()
+        with self._cancel_lock:
+            self._cancel_events[session_id] = event
+        return event
+
+    def cancel_run(self, session_id: str):
+        with self._cancel_lock:
+            event = self._cancel_events.get(session_id)
+        if event is not None:
+            event.set()
+
+    def end_run(self, session_id: str, event: threading.Event):
+        with self._cancel_lock:
+            if self._cancel_events.get(session_id) is event:
+                del self._cancel_events[session_id]
+
     def close(self):
-        self.db.close()
+        self.health.flush()
+        engine.dispose()
 
 # Singleton instance
 app_state = AppState()
+# Persist pending model health and release pooled connections when the server exits
+atexit.register(app_state.close)
@@ -1,14 +1,31 @@
+import asyncio
 import gradio as gr
 import json
 import logging
 import pandas as pd
+from datetime import datetime, time
 from app.state import app_state
+from config.settings import settings
 from core.schemas import GenerationRequest, EvaluationCriteria
-from llms.model_registry import GeneratorModels, JudgeModels, get_model_name
+from core.amplifier import TabularAmplifier, acollect_seed_rows
+from evaluation.metrics import calculate_fidelity_metrics
+from exports.datasets import DatasetStore
+from exports.exporter import export_batches_to_csv, export_batches_to_jsonl
+from llms.resilience import circuit_breaker_states
+from llms.model_registry import AUTO_MODEL, GeneratorModels, JudgeModels, get_model_name
 
 logger = logging.getLogger(__name__)
 
-def generate_data(
+def _format_samples(samples) -> str:
+    output_text = ""
+    for i, s in enumerate(samples):
+        content = s.content
+        if isinstance(content, (dict, list)):
+            content = json.dumps(content, indent=2)
+        output_text += f"Sample {i+1}:\n{content}\n" + "-"*40 + "\n"
+    return output_text
+
+async def generate_data(
     prompt, 
     data_type, 
     num_samples, 
@@ -16,8 +33,12 @@ def generate_data(
     judge_model,
     correctness, 
     schema_compliance, 
-    diversity
+    diversity,
+    request: gr.Request = None
 ):
+    session_id = request.session_hash if request is not None else "default"
+    cancel_event = app_state.begin_run(session_id)
+    verdicts = []
     try:
         req = GenerationRequest(
             prompt=prompt,
@@ -32,44 +53,227 @@ def generate_data(
             diversity=diversity
         )
         
-        # Update app refiner judge model dynamically
-        app_state.refiner.judge.model_name = judge_model
-        
-        result = app_state.refiner.generate_verified(req, criteria=criteria)
-        
-        # Calculate avg score from samples if possible (Refiner doesn't store per-sample feedback in result well right now, 
-        # but for simplicity we assume 100 if passed or we should drag feedback out.
-        # Improv: Refiner could attach feedback to result.
-        # For now, we just save.
+        # Each request gets its own refiner so the judge model is never shared between users
+        refiner = app_state.build_refiner(judge_model)
         
-        app_state.repo.save_result(req, result, avg_score=0.0) # Placeholder score
+        accepted = []
+        result = None
+        # Cancelling the Gradio event cancels this task, aborting provider calls in flight
+        async for event in refiner.aiter_generate_verified(req, criteria=criteria, cancel_event=cancel_event):
+            progress = f"Attempt {event.attempt}/{event.max_attempts}"
+            if event.kind == "attempt_started":
+                accepted = []
+                verdicts.append(f"--- {progress}: generating {req.num_samples} sample(s)")
+                yield _format_samples(accepted), f"⏳ {progress}: generating...", "\n".join(verdicts)
+            elif event.kind == "sample_judged":
+                fb = event.feedback
+                mark = "✅" if fb.passed else "❌"
+                verdicts.append(f"{mark} Sample {event.sample_index + 1}: score {fb.score} - {fb.comments}")
+                if fb.passed:
+                    accepted.append(event.sample)
+                yield _format_samples(accepted), f"⏳ {progress}: judged sample {event.sample_index + 1}", "\n".join(verdicts)
+            elif event.kind == "attempt_failed":
+                verdicts.append(f"{progress} rejected, refining prompt with judge feedback")
+                yield _format_samples(accepted), f"🔁 {progress} rejected, retrying...", "\n".join(verdicts)
+            elif event.kind == "cancelled":
+                yield _format_samples(accepted), "⏹️ Generation Cancelled", "\n".join(verdicts)
+                return
+            elif event.kind == "completed":
+                result = event.result
         
-        # Return text representation
-        output_text = ""
-        for i, s in enumerate(result.samples):
-            content = s.content
-            if isinstance(content, (dict, list)):
-                content = json.dumps(content, indent=2)
-            output_text += f"Sample {i+1}:\n{content}\n" + "-"*40 + "\n"
+        # The result carries the judge feedback, so scores are saved with it
+        await asyncio.to_thread(_save_result, req, result)
             
-        return output_text, "✅ Generation Complete"
+        yield _format_samples(result.samples), "✅ Generation Complete", "\n".join(verdicts)
     except Exception as e:
         logger.error(f"UI Error: {e}")
-        return str(e), "❌ Error Occurred"
+        yield str(e), "❌ Error Occurred", "\n".join(verdicts)
+    finally:
+        app_state.end_run(session_id, cancel_event)
+
+def _save_result(req, result):
+    with app_state.repository() as repo:
+        repo.save_result(req, result)
+
+def cancel_generation(request: gr.Request = None):
+    session_id = request.session_hash if request is not None else "default"
+    app_state.cancel_run(session_id)
+    return "⏹️ Cancelling..."
+
+async def amplify_data(prompt, model_name, seed_rows, target_rows, export_format):
+    try:
+        req = GenerationRequest(
+            prompt=prompt,
+            data_type="tabular",
+            model_name=model_name
+        )
+
+        seed = await acollect_seed_rows(app_state.generator, req, int(seed_rows))
+        amplifier = TabularAmplifier().fit(seed)
+
+        # Fidelity is measured on the first streamed batch, which is an
+        # unbiased sample of the fitted model without materialising the full dataset
+        first_batch = {}
+        def tracked_batches():
+            for batch in amplifier.iter_batches(int(target_rows)):
+                if "frame" not in first_batch:
+                    first_batch["frame"] = batch
+                yield batch
+
+        # Sampling and writing are CPU/disk bound, so they run off the event loop
+        exporter = export_batches_to_jsonl if export_format == "jsonl" else export_batches_to_csv
+        filename = await asyncio.to_thread(exporter, req.id, tracked_batches())
+
+        metrics = calculate_fidelity_metrics(amplifier.seed_frame, first_batch["frame"])
+        return json.dumps(metrics, indent=2), filename, f"✅ Amplified {len(seed)} seed rows to {int(target_rows)} rows"
+    except Exception as e:
+        logger.error(f"UI Error: {e}")
+        return str(e), None, "❌ Error Occurred"
 
 def get_history_df():
-    items = app_state.repo.get_history()
+    with app_state.repository() as repo:
+        items = repo.get_history()
+        data = []
+        for item in items:
+            data.append({
+                "ID": item.id,
+                "Prompt": item.prompt,
+                "Type": item.data_type,
+                "Model": item.model_name,
+                "Score": item.average_score,
+                "Pass Rate": item.pass_rate,
+                "Attempts": item.attempts,
+                "Tokens": item.total_tokens,
+                "Date": item.created_at
+            })
+    return pd.DataFrame(data)
+
+def _stats_row(stats):
+    return {
+        "Runs": stats.runs,
+        "Samples": stats.samples,
+        "Mean Score": stats.mean_score,
+        "Pass Rate": stats.pass_rate,
+        "Mean Attempts": stats.mean_attempts,
+        "Prompt Tokens": stats.prompt_tokens,
+        "Completion Tokens": stats.completion_tokens,
+        "Cached Tokens": stats.cached_tokens,
+        "Judge Prompt Tokens": stats.judge_prompt_tokens,
+        "Judge Completion Tokens": stats.judge_completion_tokens,
+        "Total Tokens": stats.total_tokens,
+    }
+
+def get_stats_dfs():
+    """Per-model and per-day quality/cost, read from the aggregate tables."""
+    with app_state.repository() as repo:
+        by_model = [{"Model": s.model_name, **_stats_row(s)} for s in repo.get_model_stats()]
+        by_day = [{"Day": s.day, "Model": s.model_name, **_stats_row(s)} for s in repo.get_daily_stats()]
+    return pd.DataFrame(by_model), pd.DataFrame(by_day)
+
+def _parse_date(value, end_of_day=False):
+    if not value or not value.strip():
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise gr.Error(f"Invalid date '{value}', expected YYYY-MM-DD")
+    if end_of_day and len(value.strip()) == 10:
+        parsed = datetime.combine(parsed.date(), time.max)
+    return parsed
+
+def search_history(query, model_name, data_type, min_score, max_score, date_from, date_to):
+    """
+    Full-text search over past prompts and samples. Also exposed as the
+    `/search` API endpoint.
+    """
+    if not query or not query.strip():
+        return pd.DataFrame()
+
+    with app_state.repository() as repo:
+        hits = repo.search(
+            query,
+            model_name=model_name or None,
+            data_type=data_type or None,
+            min_score=min_score,
+            max_score=max_score,
+            date_from=_parse_date(date_from),
+            date_to=_parse_date(date_to, end_of_day=True)
+        )
+    data = []
+    for hit in hits:
+        data.append({
+            "ID": hit.generation_id,
+            "Match": "prompt" if hit.sample_index is None else f"sample {hit.sample_index}",
+            "Snippet": hit.snippet,
+            "Type": hit.data_type,
+            "Model": hit.model_name,
+            "Score": hit.average_score,
+            "Date": hit.created_at
+        })
+    return pd.DataFrame(data)
+
+def get_health_df():
+    data = []
+    for h in app_state.health.snapshot():
+        data.append({
+            "Model": h.model_name,
+            "Calls": h.calls,
+            "Errors": h.errors,
+            "Error Rate": round(h.error_rate, 3),
+            "Latency (ms)": round(h.latency_ms) if h.latency_ms is not None else None,
+            "Tokens/sec": round(h.tokens_per_sec, 1) if h.tokens_per_sec is not None else None,
+            "Judge Pass Rate": round(h.judge_pass_rate, 3) if h.judge_pass_rate is not None else None,
+            "Healthy": h.is_healthy() and h.meets_quality(),
+            "Updated": h.updated_at
+        })
+    return pd.DataFrame(data)
+
+def get_breaker_df():
     data = []
-    for item in items:
+    for b in circuit_breaker_states():
         data.append({
-            "ID": item.id,
-            "Prompt": item.prompt,
-            "Type": item.data_type,
-            "Model": item.model_name,
-            "Date": item.created_at
+            "Breaker": b["name"],
+            "State": b["state"],
+            "Consecutive Failures": b["consecutive_failures"],
+            "Total Failures": b["total_failures"],
+            "Rejected Calls": b["rejected_calls"],
+            "Retry In (s)": round(b["retry_in_seconds"], 1) if b["retry_in_seconds"] is not None else None
         })
     return pd.DataFrame(data)
 
+def _split_ids(value):
+    return [v for v in (value or "").replace(",", " ").split() if v]
+
+def create_dataset_version(dataset, add_ids, remove_ids):
+    """Add/remove runs to a dataset as a new version; returns the manifest diff."""
+    try:
+        add = _split_ids(add_ids)
+        with app_state.repository() as repo:
+            runs = repo.get_run_samples(add) if add else []
+        manifest, diff = DatasetStore().create_version(dataset.strip(), add_runs=runs, remove_runs=_split_ids(remove_ids))
+        summary = {
+            "version": manifest.version,
+            "runs": len(manifest.run_ids),
+            "rows": manifest.rows,
+            "partitions_added": [p.hash for p in diff.added],
+            "partitions_removed": [p.hash for p in diff.removed],
+            "partitions_unchanged": diff.unchanged,
+        }
+        return json.dumps(summary, indent=2), f"✅ Created {dataset} v{manifest.version}"
+    except Exception as e:
+        logger.error(f"UI Error: {e}")
+        return str(e), "❌ Error Occurred"
+
+def export_dataset_delta(dataset, since_version):
+    """Write the partitions added since a version (0 = everything) for incremental sync."""
+    try:
+        since = int(since_version) if since_version else None
+        path = DatasetStore().export_delta(dataset.strip(), since)
+        return path, f"✅ Delta written to {path}"
+    except Exception as e:
+        logger.error(f"UI Error: {e}")
+        return "", f"❌ {e}"
+
 def create_ui():
     with gr.Blocks(title="Synthetic Data Generator", theme=gr.themes.Soft()) as demo:
         gr.Markdown("# 🧬 Synthetic Data Generator")
@@ -90,7 +294,7 @@ def create_ui():
 
                         with gr.Row():
                             gen_model = gr.Dropdown(
-                                choices=[m.value for m in GeneratorModels],
+                                choices=[AUTO_MODEL] + [m.value for m in GeneratorModels],
                                 value=GeneratorModels.MISTRAL_SMALL.value,
                                 label="Generator Model"
                             )
@@ -105,16 +309,50 @@ def create_ui():
                             check_schema = gr.Checkbox(label="Check Schema Compliance", value=True)
                             check_diversity = gr.Checkbox(label="Check Diversity", value=False)
                             
-                        btn_gen = gr.Button("🚀 Generate", variant="primary")
+                        with gr.Row():
+                            btn_gen = gr.Button("🚀 Generate", variant="primary")
+                            btn_cancel = gr.Button("⏹️ Cancel", variant="stop")
                         status_box = gr.Textbox(label="Status", interactive=False)
+                        verdict_log = gr.Textbox(label="Judge Verdicts", interactive=False, lines=8, autoscroll=True)
                         
                     with gr.Column(scale=1):
                         output_display = gr.Code(label="Generated Output", language="json")
                 
-                btn_gen.click(
+                gen_event = btn_gen.click(
                     generate_data,
                     inputs=[prompt_input, data_type, num_samples, gen_model, judge_model, check_correctness, check_schema, check_diversity],
-                    outputs=[output_display, status_box]
+                    outputs=[output_display, status_box, verdict_log]
+                )
+                # Flag the run so no further provider calls start, then stop streaming updates
+                btn_cancel.click(cancel_generation, outputs=status_box, cancels=[gen_event])
+
+            with gr.Tab("Amplify"):
+                gr.Markdown("## Tabular Amplification")
+                gr.Markdown("Generate seed rows with the LLM, fit their column distributions and correlations, then sample a large table locally.")
+                with gr.Row():
+                    with gr.Column(scale=1):
+                        amp_prompt = gr.TextArea(label="Prompt", placeholder="Describe the table you need...", lines=5)
+                        amp_model = gr.Dropdown(
+                            choices=[AUTO_MODEL] + [m.value for m in GeneratorModels],
+                            value=GeneratorModels.MISTRAL_SMALL.value,
+                            label="Seed Generator Model"
+                        )
+                        with gr.Row():
+                            amp_seed_rows = gr.Number(value=200, label="Seed Rows", precision=0, minimum=2, maximum=1000)
+                            amp_target_rows = gr.Number(value=100_000, label="Target Rows", precision=0, minimum=1, maximum=10_000_000)
+                            amp_format = gr.Dropdown(choices=["csv", "jsonl"], value="csv", label="Format")
+
+                        btn_amp = gr.Button("📈 Amplify", variant="primary")
+                        amp_status = gr.Textbox(label="Status", interactive=False)
+                        amp_file = gr.File(label="Amplified Dataset")
+
+                    with gr.Column(scale=1):
+                        amp_metrics = gr.Code(label="Fidelity Metrics", language="json")
+
+                btn_amp.click(
+                    amplify_data,
+                    inputs=[amp_prompt, amp_model, amp_seed_rows, amp_target_rows, amp_format],
+                    outputs=[amp_metrics, amp_file, amp_status]
                 )
 
             with gr.Tab("History"):
@@ -122,19 +360,80 @@ def create_ui():
                 refresh_btn = gr.Button("🔄 Refresh")
                 history_table = gr.Dataframe(interactive=False)
                 
+                gr.Markdown("## Quality & Cost")
+                model_stats_table = gr.Dataframe(interactive=False, label="By Model")
+                daily_stats_table = gr.Dataframe(interactive=False, label="By Day")
+                health_table = gr.Dataframe(interactive=False, label="Model Health")
+                breaker_table = gr.Dataframe(interactive=False, label="Circuit Breakers")
+                
                 refresh_btn.click(get_history_df, outputs=history_table)
+                refresh_btn.click(get_stats_dfs, outputs=[model_stats_table, daily_stats_table])
+                refresh_btn.click(get_health_df, outputs=health_table)
+                refresh_btn.click(get_breaker_df, outputs=breaker_table)
                 # Auto load on start
                 demo.load(get_history_df, outputs=history_table)
+                demo.load(get_stats_dfs, outputs=[model_stats_table, daily_stats_table])
+                demo.load(get_health_df, outputs=health_table)
+                demo.load(get_breaker_df, outputs=breaker_table)
+
+                gr.Markdown("## Search")
+                with gr.Row():
+                    search_query = gr.Textbox(label="Search prompts and samples", placeholder="e.g. invoice refund", scale=3)
+                    search_btn = gr.Button("🔍 Search", scale=1)
+                with gr.Row():
+                    search_model = gr.Dropdown(
+                        choices=[""] + [m.value for m in GeneratorModels],
+                        value="",
+                        label="Model"
+                    )
+                    search_type = gr.Dropdown(
+                        choices=["", "text", "json", "tabular", "code", "reasoning"],
+                        value="",
+                        label="Data Type"
+                    )
+                    search_min_score = gr.Number(label="Min Score", value=None)
+                    search_max_score = gr.Number(label="Max Score", value=None)
+                    search_from = gr.Textbox(label="From (YYYY-MM-DD)")
+                    search_to = gr.Textbox(label="To (YYYY-MM-DD)")
+                search_results = gr.Dataframe(interactive=False)
+
+                search_inputs = [search_query, search_model, search_type, search_min_score, search_max_score, search_from, search_to]
+                search_btn.click(search_history, inputs=search_inputs, outputs=search_results, api_name="search")
+                search_query.submit(search_history, inputs=search_inputs, outputs=search_results, api_name=False)
                 
             with gr.Tab("Export"):
-                gr.Markdown("## Export Data")
-                gr.Markdown("Select a generation from History to export (Not fully linked in this MVP, demonstrating button logic).")
+                gr.Markdown("## Versioned Datasets")
+                gr.Markdown("Group runs from History into a dataset. Each version only stores new partitions and records a diff against the previous one.")
+                with gr.Row():
+                    ds_name = gr.Textbox(label="Dataset Name", placeholder="e.g. support-emails")
+                    ds_add = gr.Textbox(label="Add Generation IDs", placeholder="Comma or space separated IDs from History")
+                    ds_remove = gr.Textbox(label="Remove Generation IDs")
+                btn_version = gr.Button("📦 Create Version", variant="primary")
+                ds_status = gr.Textbox(label="Status", interactive=False)
+                ds_diff = gr.Code(label="Manifest Diff", language="json")
                 
-                # ideally we select from history, but here we just show buttons 
-                # that would act on the 'last result' if we stored it in session state more broadly
-                # For this step, I'll just put placeholder text explaining usage.
+                btn_version.click(
+                    create_dataset_version,
+                    inputs=[ds_name, ds_add, ds_remove],
+                    outputs=[ds_diff, ds_status]
+                )
+                
+                gr.Markdown("### Delta Export")
+                with gr.Row():
+                    ds_since = gr.Number(label="Since Version (0 = full)", value=0, precision=0)
+                    btn_delta = gr.Button("⬇️ Export Delta")
+                ds_delta_path = gr.Textbox(label="Delta Directory", interactive=False)
                 
-                gr.Info("Export functionality is available via API. UI implementation requires complex state management for selection.")
+                btn_delta.click(
+                    export_dataset_delta,
+                    inputs=[ds_name, ds_since],
+                    outputs=[ds_delta_path, ds_status]
+                )
 
 
+    # Run up to UI_CONCURRENCY_LIMIT handlers per event in parallel and queue the rest
+    demo.queue(
+        default_concurrency_limit=settings.UI_CONCURRENCY_LIMIT,
+        max_size=settings.UI_QUEUE_MAX_SIZE
+    )
     return demo
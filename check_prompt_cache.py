@@ -0,0 +1,159 @@
+"""
+Check that generator shards and judge calls share a stable prompt prefix,
+against a local mock of an OpenAI-compatible endpoint that simulates prefix
+caching and reports cached tokens the way OpenAI/OpenRouter do
+(usage.prompt_tokens_details.cached_tokens). No API key or network needed.
+
+    python check_prompt_cache.py
+"""
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config.settings import settings
+from core.generator import GeneratorAgent
+from core.judge import JudgeAgent
+from core.schemas import GenerationRequest, EvaluationCriteria
+from core.token_budget import TokenEstimator
+from llms.llm_client import CACHE_BREAKPOINT, OpenAICompatibleClient
+from llms.model_registry import GeneratorModels, JudgeModels
+
+# Rough tokenizer and cache granularity of the mock
+CHARS_PER_TOKEN = 4
+CACHE_BLOCK_TOKENS = 16
+# Simulated prefill cost, so cache hits show up as lower latency
+SECONDS_PER_UNCACHED_TOKEN = 0.0005
+
+
+class MockProvider:
+    def __init__(self):
+        self.prompts = []
+        self.cache_control_seen = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _render(messages):
+        parts = []
+        for msg in messages:
+            content = msg["content"]
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content)
+            parts.append(f"{msg['role']}:{content}")
+        return "\n".join(parts)
+
+    def cached_tokens(self, prompt: str) -> int:
+        with self.lock:
+            longest = 0
+            for seen in self.prompts:
+                n = 0
+                for a, b in zip(prompt, seen):
+                    if a != b:
+                        break
+                    n += 1
+                longest = max(longest, n)
+            self.prompts.append(prompt)
+        tokens = longest // CHARS_PER_TOKEN
+        return tokens - tokens % CACHE_BLOCK_TOKENS
+
+    def complete(self, body: dict) -> dict:
+        messages = body["messages"]
+        if any(isinstance(m["content"], list) and any("cache_control" in p for p in m["content"]) for m in messages):
+            self.cache_control_seen = True
+
+        prompt = self._render(messages)
+        prompt_tokens = max(1, len(prompt) // CHARS_PER_TOKEN)
+        cached = self.cached_tokens(prompt)
+        time.sleep((prompt_tokens - cached) * SECONDS_PER_UNCACHED_TOKEN)
+
+        match = re.search(r"Number of samples to generate: (\d+)", prompt)
+        if match:
+            content = json.dumps([{"id": i, "name": f"item {i}"} for i in range(int(match.group(1)))])
+        else:
+            content = json.dumps({"score": 90, "feedback": "Looks good"})
+
+        return {
+            "id": "mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content) // CHARS_PER_TOKEN,
+                "total_tokens": prompt_tokens + len(content) // CHARS_PER_TOKEN,
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        }
+
+
+def start_mock(provider: MockProvider) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            payload = json.dumps(provider.complete(body)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def check_prompt_cache() -> bool:
+    provider = MockProvider()
+    server = start_mock(provider)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    settings.OPENROUTER_BASE_URL = base_url
+    settings.OPENROUTER_API_KEY = "mock"
+
+    try:
+        request = GenerationRequest(
+            prompt="Product catalogue entries for a hardware store",
+            data_type="json",
+            num_samples=40,
+            model_name=GeneratorModels.MISTRAL_SMALL.value,
+            schema_def={
+                "type": "object",
+                "properties": {"id": {"type": "integer"}, "name": {"type": "string"}},
+                "required": ["id", "name"]
+            }
+        )
+        # A small completion budget forces the request into several shards
+        generator = GeneratorAgent(token_estimator=TokenEstimator(max_completion_tokens=400))
+        result = generator.generate(request)
+        print(f"Generator: {len(result.samples)} samples, {result.cached_tokens}/{result.prompt_tokens} prompt tokens cached")
+
+        judge = JudgeAgent(model_name=JudgeModels.LLAMA_3_1_405B.value)
+        started = time.monotonic()
+        judge.evaluate(result.samples[:10], request.prompt, EvaluationCriteria())
+        print(
+            f"Judge: {judge.usage['cached_tokens']}/{judge.usage['prompt_tokens']} prompt tokens cached "
+            f"({time.monotonic() - started:.2f}s for 10 samples)"
+        )
+
+        # Models that need explicit breakpoints get cache_control on the stable prefix
+        client = OpenAICompatibleClient("anthropic/claude-3.5-haiku", base_url, "mock", provider="openrouter")
+        client.complete([
+            {"role": "system", "content": "Static instructions", CACHE_BREAKPOINT: True},
+            {"role": "user", "content": "Number of samples to generate: 1"}
+        ])
+        print(f"cache_control breakpoint sent: {provider.cache_control_seen}")
+
+        return result.cached_tokens > 0 and judge.usage["cached_tokens"] > 0 and provider.cache_control_seen
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    success = check_prompt_cache()
+    print("✅ Prompt prefixes are cacheable" if success else "❌ No cached tokens reported")
+    if not success:
+        sys.exit(1)
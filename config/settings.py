@@ -22,8 +22,45 @@ class Settings:
     DASHSCOPE_API_KEY: str = os.getenv("DASHSCOPE_API_KEY", "")
     DASHSCOPE_BASE_URL: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     
+    # Maximum concurrent provider calls issued by one agent call (sample splits, judge verdicts)
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+    # Provider call resilience: attempts per call, jittered backoff bounds, and provider/per-model circuit breakers
+    LLM_RETRY_ATTEMPTS: int = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+    LLM_RETRY_BASE_SECONDS: float = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+    LLM_RETRY_MAX_SECONDS: float = float(os.getenv("LLM_RETRY_MAX_SECONDS", "10"))
+    BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_SECONDS: float = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+    # CPU-bound post-processing (parsing, validation, hashing, export); 0 or 1 runs inline
+    POSTPROCESS_WORKERS: int = int(os.getenv("POSTPROCESS_WORKERS", str(os.cpu_count() or 1)))
+    POSTPROCESS_MIN_PARALLEL_ITEMS: int = int(os.getenv("POSTPROCESS_MIN_PARALLEL_ITEMS", "10000"))
+
+    # Token budgeting
+    MAX_COMPLETION_TOKENS: int = int(os.getenv("MAX_COMPLETION_TOKENS", "4096"))
+    TOKEN_BUDGET_SAFETY_MARGIN: float = float(os.getenv("TOKEN_BUDGET_SAFETY_MARGIN", "1.3"))
+    # Floor on max_tokens for reasoning models, whose thinking counts against the budget
+    REASONING_MIN_COMPLETION_TOKENS: int = int(os.getenv("REASONING_MIN_COMPLETION_TOKENS", "2048"))
+
+    # Model health tracking and the "auto" generator option
+    HEALTH_EWMA_ALPHA: float = float(os.getenv("HEALTH_EWMA_ALPHA", "0.2"))
+    HEALTH_FLUSH_SECONDS: float = float(os.getenv("HEALTH_FLUSH_SECONDS", "30"))
+    AUTO_MODEL_MAX_ERROR_RATE: float = float(os.getenv("AUTO_MODEL_MAX_ERROR_RATE", "0.3"))
+    AUTO_MODEL_MIN_PASS_RATE: float = float(os.getenv("AUTO_MODEL_MIN_PASS_RATE", "0.7"))
+    AUTO_MODEL_RETRY_SECONDS: float = float(os.getenv("AUTO_MODEL_RETRY_SECONDS", "300"))
+
+    # Versioned datasets (content-addressed partitions of at most DATASET_PARTITION_ROWS samples)
+    DATASETS_DIR: str = os.getenv("DATASETS_DIR", "./datasets")
+    DATASET_PARTITION_ROWS: int = int(os.getenv("DATASET_PARTITION_ROWS", "10000"))
+
     # Persistence
-    DATABASE_URL: str = "sqlite:///./synthetic_data.db"
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./synthetic_data.db")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
+    # UI serving
+    UI_CONCURRENCY_LIMIT: int = int(os.getenv("UI_CONCURRENCY_LIMIT", "4"))
+    UI_QUEUE_MAX_SIZE: int = int(os.getenv("UI_QUEUE_MAX_SIZE", "64"))
     
     def validate(self):
         if not self.OPENROUTER_API_KEY:
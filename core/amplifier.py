@@ -0,0 +1,269 @@
+import asyncio
+import json
+import logging
+from typing import List, Dict, Any, Optional, Iterator
+import numpy as np
+import pandas as pd
+from core.schemas import GenerationRequest, MAX_SAMPLES_PER_REQUEST
+from core.async_utils import run_sync
+from core.generator import GeneratorAgent
+from evaluation.metrics import content_hashes
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on LLM calls while collecting seed rows, relative to the ideal count.
+# Guards against looping forever when a model keeps returning unusable output.
+MAX_SEED_CALL_FACTOR = 3
+
+# Coefficients for Acklam's rational approximation of the inverse normal CDF.
+_A = (-3.969683028665376e01, 2.209460984245205e02, -2.759285104469687e02,
+      1.383577518672690e02, -3.066479806614716e01, 2.506628277459239e00)
+_B = (-5.447609879822406e01, 1.615858368580409e02, -1.556989798598866e02,
+      6.680131188771972e01, -1.328068155288572e01)
+_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e00,
+      -2.549732539343734e00, 4.374664141464968e00, 2.938163982698783e00)
+_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e00,
+      3.754408661907416e00)
+_P_LOW = 0.02425
+
+
+def _norm_ppf(u: np.ndarray) -> np.ndarray:
+    """Vectorised inverse standard normal CDF (relative error < 1.2e-9)."""
+    u = np.clip(np.asarray(u, dtype=np.float64), 1e-12, 1 - 1e-12)
+    z = np.empty_like(u)
+
+    low = u < _P_LOW
+    high = u > 1 - _P_LOW
+    mid = ~(low | high)
+
+    q = np.sqrt(-2 * np.log(u[low]))
+    z[low] = (((((_C[0] * q + _C[1]) * q + _C[2]) * q + _C[3]) * q + _C[4]) * q + _C[5]) / \
+             ((((_D[0] * q + _D[1]) * q + _D[2]) * q + _D[3]) * q + 1)
+
+    q = np.sqrt(-2 * np.log(1 - u[high]))
+    z[high] = -(((((_C[0] * q + _C[1]) * q + _C[2]) * q + _C[3]) * q + _C[4]) * q + _C[5]) / \
+              ((((_D[0] * q + _D[1]) * q + _D[2]) * q + _D[3]) * q + 1)
+
+    q = u[mid] - 0.5
+    r = q * q
+    z[mid] = (((((_A[0] * r + _A[1]) * r + _A[2]) * r + _A[3]) * r + _A[4]) * r + _A[5]) * q / \
+             (((((_B[0] * r + _B[1]) * r + _B[2]) * r + _B[3]) * r + _B[4]) * r + 1)
+    return z
+
+
+def _norm_cdf(z: np.ndarray) -> np.ndarray:
+    """Vectorised standard normal CDF (Abramowitz & Stegun 7.1.26, error < 1.5e-7)."""
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 0.5 * (1.0 + np.sign(z) * erf)
+
+
+def _is_numeric(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _NumericMarginal:
+    def __init__(self, values: np.ndarray, integer: bool):
+        self.sorted = np.sort(values)
+        self.integer = integer
+        m = len(self.sorted)
+        self.positions = (np.arange(m) + 0.5) / m
+
+    def to_normal(self, values: np.ndarray) -> np.ndarray:
+        # Mid-rank pseudo-observations keep ties at the same normal score
+        ranks = (np.searchsorted(self.sorted, values, side="left") +
+                 np.searchsorted(self.sorted, values, side="right")) / 2.0
+        return _norm_ppf(ranks / len(self.sorted))
+
+    def from_uniform(self, u: np.ndarray) -> np.ndarray:
+        values = np.interp(u, self.positions, self.sorted)
+        if self.integer:
+            return np.rint(values).astype(np.int64)
+        return values
+
+
+class _CategoricalMarginal:
+    def __init__(self, values: List[Any]):
+        keys = [self._key(v) for v in values]
+        counts: Dict[str, int] = {}
+        self.lookup: Dict[str, Any] = {}
+        for key, value in zip(keys, values):
+            counts[key] = counts.get(key, 0) + 1
+            self.lookup.setdefault(key, value)
+
+        self.categories = list(counts)
+        probs = np.array([counts[k] for k in self.categories], dtype=np.float64)
+        probs /= probs.sum()
+        self.probabilities = probs
+        self.cumulative = np.cumsum(probs)
+        self.cumulative[-1] = 1.0
+        # Midpoint of each category's interval on [0, 1], used as its pseudo-observation
+        self.midpoints = self.cumulative - probs / 2
+        self.index = {k: i for i, k in enumerate(self.categories)}
+
+    @staticmethod
+    def _key(value: Any) -> str:
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, sort_keys=True)
+        return f"{type(value).__name__}:{value}"
+
+    def to_normal(self, values: List[Any]) -> np.ndarray:
+        idx = np.array([self.index[self._key(v)] for v in values], dtype=np.int64)
+        return _norm_ppf(self.midpoints[idx])
+
+    def from_uniform(self, u: np.ndarray) -> np.ndarray:
+        idx = np.minimum(np.searchsorted(self.cumulative, u, side="right"), len(self.categories) - 1)
+        values = np.empty(len(self.categories), dtype=object)
+        values[:] = [self.lookup[k] for k in self.categories]
+        return values[idx]
+
+
+class TabularAmplifier:
+    """
+    Fits a Gaussian copula to a small set of seed rows and samples arbitrarily
+    large tables that preserve per-column marginals and pairwise correlations.
+    """
+    def __init__(self, random_state: Optional[int] = None):
+        self.rng = np.random.default_rng(random_state)
+        self.columns: List[str] = []
+        self.marginals: Dict[str, Any] = {}
+        self.null_rates: Dict[str, float] = {}
+        self.correlation: Optional[np.ndarray] = None
+        self._cholesky: Optional[np.ndarray] = None
+        self.seed_frame: Optional[pd.DataFrame] = None
+
+    def fit(self, rows: List[Dict[str, Any]]) -> "TabularAmplifier":
+        rows = [r for r in rows if isinstance(r, dict)]
+        if len(rows) < 2:
+            raise ValueError("At least two tabular seed rows are required to fit the amplifier.")
+
+        self.columns = list(dict.fromkeys(k for r in rows for k in r))
+        self.seed_frame = pd.DataFrame(rows, columns=self.columns)
+        n = len(rows)
+        normal_scores = np.zeros((n, len(self.columns)))
+
+        for j, col in enumerate(self.columns):
+            present = [(i, r[col]) for i, r in enumerate(rows) if r.get(col) is not None]
+            self.null_rates[col] = 1 - len(present) / n
+            if not present:
+                self.marginals[col] = None
+                continue
+
+            idx = np.array([i for i, _ in present], dtype=np.int64)
+            values = [v for _, v in present]
+            if all(_is_numeric(v) for v in values):
+                arr = np.asarray(values, dtype=np.float64)
+                marginal = _NumericMarginal(arr, integer=all(isinstance(v, int) for v in values))
+                normal_scores[idx, j] = marginal.to_normal(arr)
+            else:
+                marginal = _CategoricalMarginal(values)
+                normal_scores[idx, j] = marginal.to_normal(values)
+            self.marginals[col] = marginal
+
+        self.correlation = self._fit_correlation(normal_scores)
+        self._cholesky = np.linalg.cholesky(self.correlation)
+        logger.info(f"Fitted tabular amplifier on {n} seed rows, {len(self.columns)} columns.")
+        return self
+
+    @staticmethod
+    def _fit_correlation(normal_scores: np.ndarray) -> np.ndarray:
+        k = normal_scores.shape[1]
+        if k == 1:
+            return np.ones((1, 1))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = np.corrcoef(normal_scores, rowvar=False)
+        corr = np.nan_to_num(corr, nan=0.0)
+        np.fill_diagonal(corr, 1.0)
+        # Project to the nearest positive definite matrix so Cholesky always succeeds
+        eigvals, eigvecs = np.linalg.eigh(corr)
+        eigvals = np.clip(eigvals, 1e-6, None)
+        corr = eigvecs @ np.diag(eigvals) @ eigvecs.T
+        d = np.sqrt(np.diag(corr))
+        return corr / np.outer(d, d)
+
+    def sample(self, num_rows: int) -> pd.DataFrame:
+        """Sample a DataFrame of `num_rows` synthetic rows."""
+        if self._cholesky is None:
+            raise ValueError("Amplifier has not been fitted.")
+
+        z = self.rng.standard_normal((num_rows, len(self.columns))) @ self._cholesky.T
+        u = _norm_cdf(z)
+        data: Dict[str, Any] = {}
+        for j, col in enumerate(self.columns):
+            marginal = self.marginals[col]
+            if marginal is None:
+                data[col] = np.full(num_rows, None, dtype=object)
+                continue
+            values = marginal.from_uniform(u[:, j])
+            null_rate = self.null_rates[col]
+            if null_rate > 0:
+                mask = self.rng.random(num_rows) < null_rate
+                if isinstance(marginal, _NumericMarginal) and marginal.integer:
+                    # Nullable Int64 keeps integer columns integral instead of promoting to float
+                    values = pd.array(values, dtype="Int64")
+                    values[mask] = pd.NA
+                elif isinstance(marginal, _NumericMarginal):
+                    values = values.astype(np.float64)
+                    values[mask] = np.nan
+                else:
+                    values = values.astype(object)
+                    values[mask] = None
+            data[col] = values
+        return pd.DataFrame(data, columns=self.columns)
+
+    def iter_batches(self, num_rows: int, batch_size: int = 50_000) -> Iterator[pd.DataFrame]:
+        """Yield `num_rows` synthetic rows in DataFrame batches of at most `batch_size`."""
+        remaining = num_rows
+        while remaining > 0:
+            size = min(batch_size, remaining)
+            yield self.sample(size)
+            remaining -= size
+
+
+def collect_seed_rows(generator: GeneratorAgent, request: GenerationRequest, seed_size: int) -> List[Dict[str, Any]]:
+    """
+    Collect `seed_size` tabular rows from the LLM, issuing as many generation
+    calls as the per-request sample limit requires.
+    """
+    return run_sync(acollect_seed_rows(generator, request, seed_size))
+
+
+async def acollect_seed_rows(generator: GeneratorAgent, request: GenerationRequest, seed_size: int) -> List[Dict[str, Any]]:
+    """
+    Async variant of collect_seed_rows. Each round issues all the calls still
+    needed concurrently, then tops up whatever came back short. Every call
+    sends the same prompt, so exact duplicate rows are dropped: they would
+    overweight their values in the fit and flatter the fidelity metrics.
+    """
+    max_calls = MAX_SEED_CALL_FACTOR * -(-seed_size // MAX_SAMPLES_PER_REQUEST)
+    rows: List[Dict[str, Any]] = []
+    seen = set()
+    calls = 0
+
+    while len(rows) < seed_size and calls < max_calls:
+        missing = seed_size - len(rows)
+        sizes = [MAX_SAMPLES_PER_REQUEST] * (missing // MAX_SAMPLES_PER_REQUEST)
+        if missing % MAX_SAMPLES_PER_REQUEST:
+            sizes.append(missing % MAX_SAMPLES_PER_REQUEST)
+        sizes = sizes[:max_calls - calls]
+        calls += len(sizes)
+
+        results = await asyncio.gather(*[
+            generator.agenerate(request.model_copy(update={"data_type": "tabular", "num_samples": size}))
+            for size in sizes
+        ], return_exceptions=True)
+
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.warning(f"Seed generation call failed: {result}")
+                continue
+            candidates = [c for c in result.samples.iter_contents() if isinstance(c, dict)]
+            for row, digest in zip(candidates, content_hashes(candidates)):
+                if digest not in seen:
+                    seen.add(digest)
+                    rows.append(row)
+        logger.info(f"Collected {len(rows)}/{seed_size} seed rows after {calls} calls")
+
+    return rows[:seed_size]
@@ -0,0 +1,265 @@
+import json
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import pandas as pd
+
+RECORDS = "records"
+VALUES = "values"
+CONTENT_COLUMN = "content"
+
+
+def _column_array(values: List[Any]) -> np.ndarray:
+    """
+    Pack a column into the tightest array type that round-trips its values.
+    Mixed int/float columns stay object arrays: float64 would turn 0 into 0.0
+    and lose precision on large integers.
+    """
+    if values and all(type(v) is bool for v in values):
+        return np.array(values, dtype=np.bool_)
+    if values and all(type(v) is int for v in values):
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+    elif values and all(type(v) is float for v in values):
+        return np.array(values, dtype=np.float64)
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def _sample(content: Any) -> Any:
+    # Imported lazily: core.schemas depends on this module for GenerationResult
+    from core.schemas import GeneratedSample
+    return GeneratedSample(content=content)
+
+
+def _to_python(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class SampleBatch:
+    """
+    Columnar container for generated samples.
+
+    Record samples (one dict per sample) are stored as one contiguous array
+    per key, typed when the column is homogeneous, with a presence mask for
+    keys missing from some rows. Any other content is kept in a single
+    object column. Slicing returns views over the same arrays; rows are only
+    materialised as GeneratedSample objects when accessed.
+    """
+    def __init__(self, kind: str, columns: Dict[str, np.ndarray], length: int,
+                 present: Optional[Dict[str, np.ndarray]] = None):
+        self.kind = kind
+        self.columns = columns
+        self.present = present or {}
+        self._length = length
+
+    @classmethod
+    def from_contents(cls, contents: Sequence[Any]) -> "SampleBatch":
+        contents = list(contents)
+        if contents and all(isinstance(c, dict) for c in contents):
+            keys = list(dict.fromkeys(k for c in contents for k in c))
+            columns = {}
+            present = {}
+            for key in keys:
+                mask = np.fromiter((key in c for c in contents), dtype=np.bool_, count=len(contents))
+                if mask.all():
+                    columns[key] = _column_array([c[key] for c in contents])
+                    continue
+                present[key] = mask
+                values = [c[key] for c in contents if key in c]
+                packed = _column_array(values)
+                full = np.zeros(len(contents), dtype=packed.dtype) if packed.dtype != object else np.empty(len(contents), dtype=object)
+                full[mask] = packed
+                columns[key] = full
+            return cls(RECORDS, columns, len(contents), present)
+
+        column = np.empty(len(contents), dtype=object)
+        column[:] = contents
+        return cls(VALUES, {CONTENT_COLUMN: column}, len(contents))
+
+    @classmethod
+    def from_samples(cls, samples: Sequence[Any]) -> "SampleBatch":
+        """Build from GeneratedSample objects or their dict form."""
+        return cls.from_contents(
+            s[CONTENT_COLUMN] if isinstance(s, dict) else s.content for s in samples
+        )
+
+    @classmethod
+    def concat(cls, batches: Sequence["SampleBatch"]) -> "SampleBatch":
+        batches = [b for b in batches if len(b)]
+        if not batches:
+            return cls.from_contents([])
+        if len(batches) == 1:
+            return batches[0]
+        if all(b.kind == RECORDS for b in batches) and all(b.columns.keys() == batches[0].columns.keys() and not b.present for b in batches):
+            columns = {}
+            for key in batches[0].columns:
+                arrays = [b.columns[key] for b in batches]
+                # Differently typed parts (e.g. int64 and float64) fall back to
+                # Python objects, as _column_array does, rather than being coerced
+                if len({a.dtype for a in arrays}) > 1:
+                    arrays = [a.astype(object) for a in arrays]
+                columns[key] = np.concatenate(arrays)
+            return cls(RECORDS, columns, sum(len(b) for b in batches))
+        return cls.from_contents([c for b in batches for c in b.iter_contents()])
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            columns = {k: v[index] for k, v in self.columns.items()}
+            present = {k: v[index] for k, v in self.present.items()}
+            return SampleBatch(self.kind, columns, len(range(start, stop, step)), present)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("SampleBatch index out of range")
+        return _sample(self.content(index))
+
+    def __iter__(self) -> Iterator[Any]:
+        for content in self.iter_contents():
+            yield _sample(content)
+
+    def content(self, index: int) -> Any:
+        if self.kind == VALUES:
+            return self.columns[CONTENT_COLUMN][index]
+        return {
+            key: _to_python(col[index])
+            for key, col in self.columns.items()
+            if key not in self.present or self.present[key][index]
+        }
+
+    def iter_contents(self) -> Iterator[Any]:
+        if self.kind == VALUES:
+            yield from self.columns[CONTENT_COLUMN]
+            return
+        # Convert each column to Python objects once rather than per cell
+        keys = list(self.columns)
+        values = [self.columns[k].tolist() for k in keys]
+        masks = [self.present[k] if k in self.present else None for k in keys]
+        for i in range(self._length):
+            yield {
+                key: vals[i]
+                for key, vals, mask in zip(keys, values, masks)
+                if mask is None or mask[i]
+            }
+
+    def iter_json(self) -> Iterator[str]:
+        """JSON text of each sample's content, as sent to the judge or written to JSONL."""
+        for content in self.iter_contents():
+            yield json.dumps(content, default=str) if isinstance(content, (dict, list)) else str(content)
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Serialisable per-sample records, matching GeneratedSample.model_dump()."""
+        return [{CONTENT_COLUMN: c} for c in self.iter_contents()]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Tabular view: record columns map straight to DataFrame columns."""
+        if self.kind == RECORDS:
+            data = {}
+            for key, col in self.columns.items():
+                if key in self.present:
+                    col = col.astype(object)
+                    col[~self.present[key]] = None
+                data[key] = col
+            return pd.DataFrame(data)
+
+        rows = []
+        for c in self.columns[CONTENT_COLUMN]:
+            if isinstance(c, dict):
+                rows.append(c)
+            elif isinstance(c, str):
+                rows.append({CONTENT_COLUMN: c})
+            else:
+                rows.append({CONTENT_COLUMN: str(c)})
+        return pd.DataFrame(rows)
+
+
+class SharedBatchChunk:
+    """
+    Picklable description of rows [start, stop) of a SharedBatch. Typed
+    columns and presence masks travel as shared memory names; only object
+    columns are pickled.
+    """
+    def __init__(self, kind: str, start: int, stop: int, length: int, order: List[str],
+                 shared: List[Tuple[str, str, str, str]], objects: Dict[str, List[Any]]):
+        self.kind = kind
+        self.start = start
+        self.stop = stop
+        self.length = length
+        self.order = order
+        self.shared = shared
+        self.objects = objects
+
+    @contextmanager
+    def open(self) -> Iterator[SampleBatch]:
+        """Attach to the shared columns and expose the chunk as a SampleBatch view."""
+        handles = []
+        columns: Dict[str, np.ndarray] = {}
+        present: Dict[str, np.ndarray] = {}
+        try:
+            for role, key, name, dtype in self.shared:
+                shm = shared_memory.SharedMemory(name=name, track=False)
+                handles.append(shm)
+                arr = np.ndarray((self.length,), dtype=np.dtype(dtype), buffer=shm.buf)[self.start:self.stop]
+                (present if role == "present" else columns)[key] = arr
+            for key, values in self.objects.items():
+                arr = np.empty(len(values), dtype=object)
+                arr[:] = values
+                columns[key] = arr
+            yield SampleBatch(self.kind, {k: columns[k] for k in self.order}, self.stop - self.start, present)
+        finally:
+            # Views must be dropped before the mappings can be closed
+            columns.clear()
+            present.clear()
+            for shm in handles:
+                shm.close()
+
+
+class SharedBatch:
+    """
+    Copies a SampleBatch's typed columns into shared memory once so worker
+    processes can read any row range without it being pickled to them.
+    Use as a context manager; the segments are unlinked on exit.
+    """
+    def __init__(self, batch: SampleBatch):
+        self.batch = batch
+        self._segments: List[shared_memory.SharedMemory] = []
+        self._shared: List[Tuple[str, str, str, str]] = []
+
+        arrays = [("column", k, v) for k, v in batch.columns.items()] + \
+                 [("present", k, v) for k, v in batch.present.items()]
+        for role, key, arr in arrays:
+            if arr.dtype == object:
+                continue
+            shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+            self._segments.append(shm)
+            self._shared.append((role, key, shm.name, arr.dtype.str))
+
+    def chunk(self, start: int, stop: int) -> SharedBatchChunk:
+        objects = {
+            k: v[start:stop].tolist()
+            for k, v in self.batch.columns.items() if v.dtype == object
+        }
+        return SharedBatchChunk(
+            self.batch.kind, start, stop, len(self.batch), list(self.batch.columns), self._shared, objects
+        )
+
+    def close(self):
+        for shm in self._segments:
+            shm.close()
+            shm.unlink()
+        self._segments = []
+
+    def __enter__(self) -> "SharedBatch":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
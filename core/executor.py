@@ -0,0 +1,109 @@
+import logging
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple, TypeVar
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Chunks per worker, so a slow chunk does not leave the other cores idle
+CHUNKS_PER_WORKER = 4
+
+
+class StageExecutor:
+    """
+    Runs CPU-bound post-processing stages (parsing, validation, hashing,
+    serialisation) over chunks of items.
+
+    With `max_workers` > 1 large inputs fan out over a process pool, which
+    sidesteps the GIL; small inputs, or `max_workers` <= 1, run inline where
+    process hand-off would cost more than it saves. Stage functions must be
+    module-level so they can be pickled, take a chunk (plus extra args) and
+    return a list with one result per item.
+    """
+    def __init__(self, max_workers: int = 0, min_parallel_items: Optional[int] = None):
+        self.max_workers = max_workers
+        self.min_parallel_items = min_parallel_items or settings.POSTPROCESS_MIN_PARALLEL_ITEMS
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def parallel(self) -> bool:
+        return self.max_workers > 1
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn, not fork: the server process runs threads (Gradio, DB pool)
+                # that must not be duplicated into workers mid-operation
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info(f"Started post-processing pool with {self.max_workers} workers")
+            return self._pool
+
+    def ranges(self, length: int) -> List[Tuple[int, int]]:
+        """Split [0, length) into contiguous chunk boundaries."""
+        if length == 0:
+            return []
+        chunks = max(1, self.max_workers * CHUNKS_PER_WORKER) if self.parallel else 1
+        size = math.ceil(length / chunks)
+        return [(start, min(start + size, length)) for start in range(0, length, size)]
+
+    def should_parallelize(self, num_items: int) -> bool:
+        return self.parallel and num_items >= self.min_parallel_items
+
+    def map_chunks(self,
+                   fn: Callable[..., List[R]],
+                   items: Sequence[T],
+                   *args: Any,
+                   parallel: Optional[bool] = None) -> List[R]:
+        """
+        Apply `fn(chunk, *args)` over `items`, preserving order. `parallel`
+        overrides the item-count threshold when the caller knows the cost better.
+        """
+        if parallel is None:
+            parallel = self.should_parallelize(len(items))
+        if not (parallel and self.parallel) or len(items) <= 1:
+            return fn(items, *args)
+
+        pool = self._get_pool()
+        futures = [pool.submit(fn, items[start:stop], *args) for start, stop in self.ranges(len(items))]
+        results: List[R] = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+_default_executor: Optional[StageExecutor] = None
+_default_lock = threading.Lock()
+
+
+def get_executor() -> StageExecutor:
+    """Process-wide executor sized by POSTPROCESS_WORKERS."""
+    global _default_executor
+    with _default_lock:
+        if _default_executor is None:
+            _default_executor = StageExecutor(max_workers=settings.POSTPROCESS_WORKERS)
+        return _default_executor
+
+
+def set_executor(executor: StageExecutor):
+    """Replace the process-wide executor (e.g. a differently sized pool)."""
+    global _default_executor
+    with _default_lock:
+        if _default_executor is not None and _default_executor is not executor:
+            _default_executor.shutdown()
+        _default_executor = executor
@@ -1,104 +1,233 @@
+import asyncio
 import json
 import logging
-from typing import List, Dict, Any, Optional
-from core.schemas import GenerationRequest, GenerationResult, GeneratedSample
-from llms.llm_client import get_llm_client
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+from config.settings import settings
+from core.async_utils import run_sync
+from core.batch import SampleBatch
+from core.executor import StageExecutor, get_executor
+from core.schemas import GenerationRequest, GenerationResult
+from core.token_budget import TokenEstimator
+from llms.llm_client import CACHE_BREAKPOINT, get_llm_client, UnifiedLLMClient
+from llms.model_health import get_health_registry
+from llms.model_registry import AUTO_MODEL, GeneratorModels
 
 logger = logging.getLogger(__name__)
 
+# Below this much raw text, parsing inline beats shipping it to worker processes
+PARSE_PARALLEL_MIN_CHARS = 4_000_000
+
 class GeneratorAgent:
-    def __init__(self):
-        pass
+    def __init__(self, token_estimator: Optional[TokenEstimator] = None, executor: Optional[StageExecutor] = None):
+        self.token_estimator = token_estimator or TokenEstimator()
+        self.executor = executor or get_executor()
         
     def generate(self, request: GenerationRequest) -> GenerationResult:
         """
         Main entry point for generating data.
         """
+        return run_sync(self.agenerate(request))
+
+    async def agenerate(self, request: GenerationRequest) -> GenerationResult:
+        """
+        Async entry point for generating data.
+        Large requests are split across concurrent calls according to the token plan.
+        """
+        if request.model_name == AUTO_MODEL:
+            # Resolved per call, so a refine retry can move off a model that degraded
+            model_name = await asyncio.to_thread(self.resolve_auto_model)
+            request = request.model_copy(update={"model_name": model_name})
+
         client = get_llm_client(model_name=request.model_name)
+        # Planning may read token history from the DB, so keep it off the event loop
+        plan = await asyncio.to_thread(
+            self.token_estimator.plan,
+            request.model_name, request.data_type, request.num_samples, request.schema_def
+        )
+        if len(plan.samples_per_call) > 1:
+            logger.info(
+                f"Splitting {request.num_samples} samples into calls of {plan.samples_per_call} "
+                f"(~{plan.tokens_per_sample:.0f} tokens/sample from {plan.source})"
+            )
         
         system_prompt = self._build_system_prompt(request)
-        user_prompt = self._build_user_prompt(request)
+        semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
         
-        is_json = request.data_type.lower() in ["json", "tabular"]
+        async def bounded_call(count: int, max_tokens: int):
+            async with semaphore:
+                return await self._agenerate_call(client, request, system_prompt, count, max_tokens)
         
         try:
-            raw_response = client.generate(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                json_mode=is_json
+            calls = await asyncio.gather(*[
+                bounded_call(count, max_tokens)
+                for count, max_tokens in zip(plan.samples_per_call, plan.max_tokens)
+            ])
+            
+            raw_outputs = [raw_response for raw_response, _, _, _ in calls]
+            
+            # Parsing is CPU-bound: run it off the event loop, and over the
+            # process pool when there is enough text to be worth shipping
+            parsed = await asyncio.to_thread(
+                self.executor.map_chunks,
+                _parse_chunk, raw_outputs, request.data_type,
+                parallel=sum(len(r) for r in raw_outputs) >= PARSE_PARALLEL_MIN_CHARS
             )
             
-            samples = self._parse_response(raw_response, request.data_type, request.num_samples)
+            batches: List[SampleBatch] = []
+            prompt_tokens = 0
+            completion_tokens = 0
+            sample_completion_tokens = 0
+            cached_tokens = 0
+            truncated = False
+            for (_, usage, final_completion_tokens, call_truncated), contents in zip(calls, parsed):
+                batches.append(SampleBatch.from_contents(contents))
+                prompt_tokens += usage.get("prompt_tokens", 0)
+                completion_tokens += usage.get("completion_tokens", 0)
+                cached_tokens += usage.get("cached_tokens", 0)
+                sample_completion_tokens += final_completion_tokens
+                truncated = truncated or call_truncated
+                if not call_truncated:
+                    self.token_estimator.record(
+                        request.model_name, request.data_type, request.schema_def,
+                        final_completion_tokens, len(contents)
+                    )
             
             return GenerationResult(
                 request_id=request.id,
-                samples=samples,
-                raw_output=raw_response,
-                model_used=request.model_name
+                samples=SampleBatch.concat(batches),
+                raw_output="\n".join(raw_outputs),
+                model_used=request.model_name,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cached_tokens=cached_tokens,
+                final_completion_tokens=sample_completion_tokens,
+                truncated=truncated
             )
             
         except Exception as e:
             logger.error(f"Generation failed: {e}")
             raise
 
-    def _build_system_prompt(self, request: GenerationRequest) -> str:
-        base = "You are a highly advanced synthetic data generator. Your goal is to produce high-quality, diverse, and realistic data."
+    def resolve_auto_model(self) -> str:
+        """The generator model "auto" currently stands for."""
+        model_name = get_health_registry().select([m.value for m in GeneratorModels])
+        logger.info(f"Auto model selection picked {model_name}")
+        return model_name
+
+    async def _agenerate_call(
+        self,
+        client: UnifiedLLMClient,
+        request: GenerationRequest,
+        system_prompt: str,
+        count: int,
+        max_tokens: int
+    ) -> Tuple[str, Dict[str, int], int, bool]:
+        """
+        Run one planned call; returns (raw output, token usage including any
+        truncated attempt, completion tokens of the final attempt, truncated).
+        """
+        call_request = request.model_copy(update={"num_samples": count})
+        # Shards of one request share everything up to the sample count, which comes last
+        messages = [
+            {"role": "system", "content": system_prompt, CACHE_BREAKPOINT: True},
+            {"role": "user", "content": self._build_user_prompt(call_request)}
+        ]
+        is_json = request.data_type.lower() in ["json", "tabular"]
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
         
-        if request.data_type == "json":
-            base += "\nYou must output VALID JSON only. Do not include markdown fencing like ```json."
-            if request.schema_def:
-                base += f"\nFollow this JSON schema strictly:\n{json.dumps(request.schema_def, indent=2)}"
-        elif request.data_type == "tabular":
-            base += "\nOutput data as a list of JSON objects, which will be converted to CSV/Table. VALID JSON list only."
-        else:
-            base += "\nFollow the user's instructions precisely."
-            
-        return base
+        response = await client.acomplete(messages=messages, json_mode=is_json, max_tokens=max_tokens)
+        
+        if response.finish_reason == "length" and max_tokens < self.token_estimator.max_completion_tokens:
+            # The estimate was too low: retry once with the full budget
+            logger.warning(f"Completion truncated at {max_tokens} tokens, retrying with a larger budget")
+            for k in usage:
+                usage[k] += response.usage.get(k, 0)
+            response = await client.acomplete(
+                messages=messages,
+                json_mode=is_json,
+                max_tokens=self.token_estimator.max_completion_tokens
+            )
+        
+        for k in usage:
+            usage[k] += response.usage.get(k, 0)
+        # Only the final completion reflects what the samples actually cost
+        final_completion_tokens = response.usage.get("completion_tokens", 0)
+        
+        return response.content, usage, final_completion_tokens, response.finish_reason == "length"
+
+    def _build_system_prompt(self, request: GenerationRequest) -> str:
+        # Built once per distinct schema, so every call with the same schema
+        # gets a byte-identical (provider-cacheable) system prompt
+        schema_key = json.dumps(request.schema_def, separators=(",", ":")) if request.schema_def else None
+        return _system_prompt(request.data_type, schema_key)
 
     def _build_user_prompt(self, request: GenerationRequest) -> str:
         prompt = f"Request: {request.prompt}\n"
-        prompt += f"Number of samples to generate: {request.num_samples}\n"
         if request.data_type == "text":
-            prompt += "Separate samples with '---' if multiple are requested."
+            prompt += "Separate samples with '---' if multiple are requested.\n"
+        prompt += f"Number of samples to generate: {request.num_samples}\n"
         return prompt
 
-    def _parse_response(self, raw_response: str, data_type: str, expected_count: int) -> List[GeneratedSample]:
-        samples = []
+
+@lru_cache(maxsize=256)
+def _system_prompt(data_type: str, schema_key: Optional[str]) -> str:
+    base = "You are a highly advanced synthetic data generator. Your goal is to produce high-quality, diverse, and realistic data."
+    
+    if data_type == "json":
+        base += "\nYou must output VALID JSON only. Do not include markdown fencing like ```json."
+        if schema_key:
+            base += f"\nFollow this JSON schema strictly:\n{json.dumps(json.loads(schema_key), indent=2)}"
+    elif data_type == "tabular":
+        base += "\nOutput data as a list of JSON objects, which will be converted to CSV/Table. VALID JSON list only."
+    else:
+        base += "\nFollow the user's instructions precisely."
         
-        if data_type.lower() in ["json", "tabular"]:
-            try:
-                # cleaner parsing if markdown fences exist
-                cleaned = raw_response.strip()
-                if cleaned.startswith("```json"):
-                    cleaned = cleaned[7:]
-                if cleaned.endswith("```"):
-                    cleaned = cleaned[:-3]
-                cleaned = cleaned.strip()
-                
-                parsed = json.loads(cleaned)
+    return base
+
+
+
+def _parse_chunk(raw_responses: List[str], data_type: str) -> List[List[Any]]:
+    return [parse_response(raw, data_type) for raw in raw_responses]
+
+
+def parse_response(raw_response: str, data_type: str) -> List[Any]:
+    """Split one raw completion into sample contents."""
+    samples = []
+    if not raw_response.strip():
+        return samples
+    
+    if data_type.lower() in ["json", "tabular"]:
+        try:
+            # cleaner parsing if markdown fences exist
+            cleaned = raw_response.strip()
+            if cleaned.startswith("```json"):
+                cleaned = cleaned[7:]
+            if cleaned.endswith("```"):
+                cleaned = cleaned[:-3]
+            cleaned = cleaned.strip()
+            
+            parsed = json.loads(cleaned)
+            
+            if isinstance(parsed, list):
+                samples.extend(parsed)
+            elif isinstance(parsed, dict):
+                # Maybe wrapped in a key? or single item
+                samples.append(parsed)
+            else:
+                samples.append(str(parsed))
                 
-                if isinstance(parsed, list):
-                    for item in parsed:
-                        samples.append(GeneratedSample(content=item))
-                elif isinstance(parsed, dict):
-                    # Maybe wrapped in a key? or single item
-                    samples.append(GeneratedSample(content=parsed))
-                else:
-                    samples.append(GeneratedSample(content=str(parsed)))
-                    
-            except json.JSONDecodeError:
-                logger.warning("Failed to parse JSON response. Returning raw string.")
-                samples.append(GeneratedSample(content=raw_response))
+        except json.JSONDecodeError:
+            logger.warning("Failed to parse JSON response. Returning raw string.")
+            samples.append(raw_response)
+    else:
+        # Text split
+        if "---" in raw_response:
+            parts = raw_response.split("---")
+            for p in parts:
+                if p.strip():
+                    samples.append(p.strip())
         else:
-            # Text split
-            if "---" in raw_response:
-                parts = raw_response.split("---")
-                for p in parts:
-                    if p.strip():
-                        samples.append(GeneratedSample(content=p.strip()))
-            else:
-                 samples.append(GeneratedSample(content=raw_response))
-                 
-        return samples
+             samples.append(raw_response)
+             
+    return samples
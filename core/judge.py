@@ -1,71 +1,147 @@
+import asyncio
 import logging
 import json
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Iterator, AsyncIterator, Tuple, Union
+from config.settings import settings
+from core.async_utils import run_sync, iterate_sync
+from core.batch import SampleBatch
 from core.schemas import GeneratedSample, Feedback, EvaluationCriteria
-from llms.llm_client import get_llm_client
-from evaluation.metrics import validate_json_schema
+from llms.llm_client import CACHE_BREAKPOINT, get_llm_client, UnifiedLLMClient
+from llms.resilience import is_unrecoverable
+from evaluation.metrics import validate_json_schema_batch
 
 logger = logging.getLogger(__name__)
 
 class JudgeAgent:
     def __init__(self, model_name: str):
         self.model_name = model_name
+        # Token usage of every judge call made by this agent, including prompt-cache hits
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
         
     def evaluate(self, 
-                 samples: List[GeneratedSample], 
+                 samples: Union[SampleBatch, List[GeneratedSample]], 
                  original_prompt: str, 
                  criteria: EvaluationCriteria,
                  schema: Optional[dict] = None) -> List[Feedback]:
         """
         Evaluate a list of samples against criteria.
         """
-        feedbacks = []
+        return run_sync(self.aevaluate(samples, original_prompt, criteria, schema))
+
+    def iter_evaluate(self, 
+                      samples: Union[SampleBatch, List[GeneratedSample]], 
+                      original_prompt: str, 
+                      criteria: EvaluationCriteria,
+                      schema: Optional[dict] = None) -> Iterator[Tuple[int, Feedback]]:
+        """
+        Yield (sample index, verdict) pairs as soon as each verdict is available.
+        """
+        return iterate_sync(self.aiter_evaluate(samples, original_prompt, criteria, schema))
+
+    async def aevaluate(self, 
+                        samples: Union[SampleBatch, List[GeneratedSample]], 
+                        original_prompt: str, 
+                        criteria: EvaluationCriteria,
+                        schema: Optional[dict] = None) -> List[Feedback]:
+        """
+        Evaluate all samples concurrently, returning verdicts in sample order.
+        """
+        feedbacks: List[Optional[Feedback]] = [None] * len(samples)
+        async for i, feedback in self.aiter_evaluate(samples, original_prompt, criteria, schema):
+            feedbacks[i] = feedback
+        return feedbacks
+
+    async def aiter_evaluate(self, 
+                             samples: Union[SampleBatch, List[GeneratedSample]], 
+                             original_prompt: str, 
+                             criteria: EvaluationCriteria,
+                             schema: Optional[dict] = None) -> AsyncIterator[Tuple[int, Feedback]]:
+        """
+        Evaluate samples concurrently, yielding (sample index, verdict) pairs in completion order.
+        """
         client = get_llm_client(model_name=self.model_name)
-        
-        for sample in samples:
-            # 1. Hard check: Schema validation
-            if schema and isinstance(sample.content, (dict, list)):
-                if not validate_json_schema(sample.content, schema):
-                    feedbacks.append(Feedback(
+        semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+        # Work from the raw contents so no per-row sample objects are built
+        if not isinstance(samples, SampleBatch):
+            samples = SampleBatch.from_samples(samples)
+        contents = list(samples.iter_contents())
+
+        # Hard checks run for the whole batch up front; they are CPU-bound and
+        # may fan out over the post-processing pool, so keep them off the event loop
+        hard_failures = await asyncio.to_thread(self._hard_checks, contents, schema)
+        instructions = self._build_judge_instructions(original_prompt, criteria)
+
+        async def judge(i: int, content: Any) -> Tuple[int, Feedback]:
+            if i in hard_failures:
+                return i, hard_failures[i]
+            async with semaphore:
+                return i, await self._aevaluate_sample(client, content, instructions)
+
+        tasks = [asyncio.ensure_future(judge(i, content)) for i, content in enumerate(contents)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Stop outstanding judge calls if the consumer goes away early
+            for task in tasks:
+                task.cancel()
+
+    def _hard_checks(self, contents: List[Any], schema: Optional[dict]) -> Dict[int, Feedback]:
+        """Deterministic checks that fail samples without an LLM call, keyed by sample index."""
+        failures: Dict[int, Feedback] = {}
+
+        # Schema validation
+        if schema:
+            structured = [i for i, c in enumerate(contents) if isinstance(c, (dict, list))]
+            valid = validate_json_schema_batch([contents[i] for i in structured], schema)
+            for i, ok in zip(structured, valid):
+                if not ok:
+                    failures[i] = Feedback(
                         score=0, 
                         comments="Failed JSON Schema Validation", 
                         passed=False
-                    ))
-                    continue
+                    )
 
-            # 2. LLM Evaluation
-            # We treat content as string for the prompt
-            content_str = json.dumps(sample.content) if isinstance(sample.content, (dict, list)) else str(sample.content)
-            
-            prompt = self._build_judge_prompt(content_str, original_prompt, criteria)
+        return failures
+
+    async def _aevaluate_sample(self,
+                                client: UnifiedLLMClient,
+                                content: Any,
+                                instructions: str) -> Feedback:
+        # LLM Evaluation
+        # We treat content as string for the prompt
+        content_str = json.dumps(content) if isinstance(content, (dict, list)) else str(content)
+        
+        # Instructions are identical for every sample of a request and go first,
+        # so providers can serve them from their prompt cache; only the sample varies
+        messages = [
+            {"role": "system", "content": instructions, CACHE_BREAKPOINT: True},
+            {"role": "user", "content": f"Generated Content to Evaluate:\n{content_str}"}
+        ]
+        
+        try:
+            response = await client.acomplete(messages=messages, json_mode=True)
+            for k in self.usage:
+                self.usage[k] += response.usage.get(k, 0)
             
-            try:
-                response = client.generate(
-                    messages=[{"role": "user", "content": prompt}],
-                    json_mode=True
-                )
-                
-                eval_data = json.loads(response)
-                feedbacks.append(Feedback(
-                    score=eval_data.get("score", 0),
-                    comments=eval_data.get("feedback", "No feedback provided"),
-                    passed=eval_data.get("score", 0) >= 70 # Threshold
-                ))
-            except Exception as e:
-                logger.error(f"Judge evaluation failed: {e}")
-                feedbacks.append(Feedback(score=0, comments=f"Error: {e}", passed=False))
-                
-        return feedbacks
+            eval_data = json.loads(response.content)
+            return Feedback(
+                score=eval_data.get("score", 0),
+                comments=eval_data.get("feedback", "No feedback provided"),
+                passed=eval_data.get("score", 0) >= 70 # Threshold
+            )
+        except Exception as e:
+            if is_unrecoverable(e):
+                # Every other sample would fail the same way; abort instead of scoring them all 0
+                raise
+            logger.error(f"Judge evaluation failed: {e}")
+            return Feedback(score=0, comments=f"Error: {e}", passed=False, judge_error=True)
 
-    def _build_judge_prompt(self, content: str, original_prompt: str, criteria: EvaluationCriteria) -> str:
+    def _build_judge_instructions(self, original_prompt: str, criteria: EvaluationCriteria) -> str:
         return f"""
         You are an impartial judge evaluating synthetic data.
         
-        Original User Request: {original_prompt}
-        
-        Generated Content to Evaluate:
-        {content}
-        
         Evaluation Criteria:
         - Correctness: {criteria.correctness}
         - Schema Compliance: {criteria.schema_compliance}
@@ -76,4 +152,6 @@ class JudgeAgent:
             "score": <0-100 integer>,
             "feedback": "<detailed critique>"
         }}
+        
+        Original User Request: {original_prompt}
         """
@@ -1,9 +1,13 @@
 import logging
 import copy
-from typing import List, Optional
-from core.schemas import GenerationRequest, GenerationResult, EvaluationCriteria
+import threading
+from contextlib import aclosing
+from typing import List, Optional, Iterator, AsyncIterator
+from core.async_utils import run_sync, iterate_sync
+from core.schemas import GenerationRequest, GenerationResult, EvaluationCriteria, RefinementEvent
 from core.generator import GeneratorAgent
 from core.judge import JudgeAgent
+from llms.model_health import get_health_registry
 from llms.model_registry import JudgeModels
 
 logger = logging.getLogger(__name__)
@@ -12,59 +16,158 @@ class RefinerAgent:
     def __init__(self, generator: GeneratorAgent, judge_model: str = JudgeModels.LLAMA_3_1_405B):
         self.generator = generator
         self.judge = JudgeAgent(model_name=judge_model)
-        
-    def generate_verified(self, 
-                          request: GenerationRequest, 
+
+    def generate_verified(self,
+                          request: GenerationRequest,
                           max_retries: int = 3,
                           criteria: Optional[EvaluationCriteria] = None) -> GenerationResult:
         """
-        Generate data, evaluate it, and regenerate if necessary.
+        Generate data, evaluate it, and regenerate if necessary. The result
+        carries the judge feedback for its samples and the attempts it took.
+        """
+        return run_sync(self.agenerate_verified(request, max_retries, criteria))
+
+    def iter_generate_verified(self,
+                               request: GenerationRequest,
+                               max_retries: int = 3,
+                               criteria: Optional[EvaluationCriteria] = None,
+                               cancel_event: Optional[threading.Event] = None) -> Iterator[RefinementEvent]:
+        """
+        Synchronous view of aiter_generate_verified.
+        """
+        return iterate_sync(self.aiter_generate_verified(request, max_retries, criteria, cancel_event))
+
+    async def agenerate_verified(self,
+                                 request: GenerationRequest,
+                                 max_retries: int = 3,
+                                 criteria: Optional[EvaluationCriteria] = None) -> GenerationResult:
+        """
+        Async variant of generate_verified.
+        """
+        result = None
+        async for event in self.aiter_generate_verified(request, max_retries, criteria):
+            if event.result is not None:
+                result = event.result
+        return result
+
+    async def aiter_generate_verified(self,
+                                      request: GenerationRequest,
+                                      max_retries: int = 3,
+                                      criteria: Optional[EvaluationCriteria] = None,
+                                      cancel_event: Optional[threading.Event] = None) -> AsyncIterator[RefinementEvent]:
+        """
+        Run the generate/judge/refine loop, yielding a RefinementEvent as each
+        attempt starts and each sample is judged. The final event carries the result.
+        Setting `cancel_event` stops the loop before the next provider call;
+        cancelling the consuming task also aborts calls already in flight.
         """
         if criteria is None:
             criteria = EvaluationCriteria()
-            
+
         current_request = request
         attempt = 0
-        
+        max_attempts = max_retries + 1
+        result = None
+        # Generator and judge usage summed over every attempt, not just the one that is kept
+        spent = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        judge_spent = {"prompt_tokens": 0, "completion_tokens": 0}
+
+        def cancelled() -> bool:
+            return cancel_event is not None and cancel_event.is_set()
+
         while attempt <= max_retries:
+            if cancelled():
+                logger.info("Generation cancelled.")
+                yield RefinementEvent(kind="cancelled", attempt=attempt, max_attempts=max_attempts, result=result)
+                return
+
             attempt += 1
-            logger.info(f"Generation attempt {attempt}/{max_retries + 1}")
-            
+            logger.info(f"Generation attempt {attempt}/{max_attempts}")
+            yield RefinementEvent(kind="attempt_started", attempt=attempt, max_attempts=max_attempts)
+
             # 1. Generate
-            result = self.generator.generate(current_request)
-            
-            # 2. Evaluate
-            feedbacks = self.judge.evaluate(
+            result = await self.generator.agenerate(current_request)
+            for k in spent:
+                spent[k] += getattr(result, k)
+            judge_usage_before = dict(self.judge.usage)
+
+            # 2. Evaluate (samples are judged concurrently, verdicts arrive in completion order)
+            feedbacks = [None] * len(result.samples)
+            judged = 0
+            verdicts = self.judge.aiter_evaluate(
                 samples=result.samples,
                 original_prompt=request.prompt,  # Always judge against original intent
                 criteria=criteria,
                 schema=request.schema_def
             )
-            
+            async with aclosing(verdicts):
+                async for i, feedback in verdicts:
+                    feedbacks[i] = feedback
+                    judged += 1
+                    yield RefinementEvent(
+                        kind="sample_judged",
+                        attempt=attempt,
+                        max_attempts=max_attempts,
+                        sample_index=i,
+                        sample=result.samples[i],
+                        feedback=feedback
+                    )
+                    if cancelled() and judged < len(result.samples):
+                        logger.info("Generation cancelled.")
+                        yield RefinementEvent(kind="cancelled", attempt=attempt, max_attempts=max_attempts, result=result)
+                        return
+
+            for k in judge_spent:
+                judge_spent[k] += self.judge.usage[k] - judge_usage_before[k]
+            result.attempts = attempt
+            result.prompt_tokens = spent["prompt_tokens"]
+            result.completion_tokens = spent["completion_tokens"]
+            result.cached_tokens = spent["cached_tokens"]
+            result.judge_prompt_tokens = judge_spent["prompt_tokens"]
+            result.judge_completion_tokens = judge_spent["completion_tokens"]
+            result.total_tokens = (
+                result.prompt_tokens + result.completion_tokens
+                + result.judge_prompt_tokens + result.judge_completion_tokens
+            )
+            result.feedback = feedbacks
+            # Verdicts the judge failed to produce say nothing about the generator
+            judged_feedbacks = [f for f in feedbacks if not f.judge_error]
+            get_health_registry().record_judgement(
+                result.model_used, sum(1 for f in judged_feedbacks if f.passed), len(judged_feedbacks)
+            )
+
             # Check if all passed
             all_passed = all(f.passed for f in feedbacks)
-            
+
             if all_passed:
                 logger.info("All samples passed evaluation.")
-                return result
-            
+                yield RefinementEvent(kind="completed", attempt=attempt, max_attempts=max_attempts, result=result)
+                return
+
+            # Regenerating cannot fix verdicts the judge failed to produce
+            if all(f.judge_error for f in feedbacks if not f.passed):
+                logger.warning("Every rejection was a judge error. Returning last result.")
+                yield RefinementEvent(kind="completed", attempt=attempt, max_attempts=max_attempts, result=result)
+                return
+
             if attempt > max_retries:
                 logger.warning("Max retries reached. Returning last result.")
-                return result
-                
+                yield RefinementEvent(kind="completed", attempt=attempt, max_attempts=max_attempts, result=result)
+                return
+
+            yield RefinementEvent(kind="attempt_failed", attempt=attempt, max_attempts=max_attempts)
+
             # 3. Refine Prompt (Simple strategy: Append feedback to prompt)
             # We construct a new prompt for the next iteration
             logger.info("Refining prompt based on feedback...")
-            
+
             failed_feedback_summary = "\n".join(
                 [f"- {f.comments}" for f in feedbacks if not f.passed]
             )
-            
+
             refined_prompt = f"{request.prompt}\n\nPREVIOUS ATTEMPT FAILED. FEEDBACK:\n{failed_feedback_summary}\n\nFIX THE ISSUES."
-            
+
             # Update request for next loop
             # We use copy to not mutate original if intended to reuse
             current_request = copy.deepcopy(request)
             current_request.prompt = refined_prompt
-            
-        return result
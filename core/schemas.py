@@ -1,13 +1,17 @@
-from typing import Dict, List, Optional, Any, Union
-from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Any, Union, Literal
+from pydantic import BaseModel, ConfigDict, Field, field_serializer, field_validator
 from datetime import datetime
 import uuid
+from core.batch import SampleBatch
+
+# Upper bound on samples an LLM is asked for in a single generation request
+MAX_SAMPLES_PER_REQUEST = 50
 
 class GenerationRequest(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     prompt: str
     data_type: str = Field(..., description="Type of data: tabular, json, text, etc.")
-    num_samples: int = Field(default=1, ge=1, le=50)
+    num_samples: int = Field(default=1, ge=1, le=MAX_SAMPLES_PER_REQUEST)
     schema_def: Optional[Dict[str, Any]] = Field(default=None, description="JSON schema if applicable")
     model_name: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -15,19 +19,65 @@ class GenerationRequest(BaseModel):
 class GeneratedSample(BaseModel):
     content: Union[str, Dict[str, Any]]
     
+class Feedback(BaseModel):
+    score: int = Field(..., ge=0, le=100)
+    comments: str
+    passed: bool
+    judge_error: bool = Field(default=False, description="True if the judge call failed, so the score says nothing about the sample")
+
 class GenerationResult(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     request_id: str
-    samples: List[GeneratedSample]
+    samples: SampleBatch
     raw_output: str
     model_used: str
+    prompt_tokens: int = Field(default=0, description="Generator prompt tokens, across all attempts once refined")
+    completion_tokens: int = Field(default=0, description="Generator completion tokens, across all attempts once refined")
+    cached_tokens: int = Field(default=0, description="Prompt tokens served from the provider's prompt cache")
+    final_completion_tokens: int = Field(default=0, description="Completion tokens of the calls' final attempts, which produced the samples")
+    truncated: bool = Field(default=False, description="True if any call hit its max_tokens limit")
+    attempts: int = Field(default=1, description="Generate/judge rounds the refine loop ran")
+    judge_prompt_tokens: int = Field(default=0, description="Judge prompt tokens across all attempts")
+    judge_completion_tokens: int = Field(default=0, description="Judge completion tokens across all attempts")
+    total_tokens: int = Field(default=0, description="Generator and judge prompt and completion tokens across all attempts")
+    feedback: List[Feedback] = Field(default_factory=list, description="Judge verdict per sample, aligned with samples")
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+    @field_validator("samples", mode="before")
+    @classmethod
+    def _coerce_samples(cls, value: Any) -> SampleBatch:
+        # Lists of GeneratedSample (or their dict form) are packed into columns
+        if isinstance(value, SampleBatch):
+            return value
+        return SampleBatch.from_samples(value)
+
+    @field_serializer("samples")
+    def _serialize_samples(self, samples: SampleBatch) -> List[Dict[str, Any]]:
+        return samples.to_records()
+
 class EvaluationCriteria(BaseModel):
     correctness: bool = True
     schema_compliance: bool = True
     diversity: bool = False
     
-class Feedback(BaseModel):
-    score: int = Field(..., ge=0, le=100)
-    comments: str
-    passed: bool
+class RefinementEvent(BaseModel):
+    """Progress update emitted by the refine loop while it runs."""
+    kind: Literal["attempt_started", "sample_judged", "attempt_failed", "completed", "cancelled"]
+    attempt: int
+    max_attempts: int
+    sample_index: Optional[int] = None
+    sample: Optional[GeneratedSample] = None
+    feedback: Optional[Feedback] = None
+    result: Optional[GenerationResult] = None
+
+class SearchHit(BaseModel):
+    """A prompt (sample_index is None) or sample matching a search query."""
+    generation_id: str
+    sample_index: Optional[int] = None
+    snippet: str
+    prompt: str
+    model_name: str
+    data_type: str
+    average_score: Optional[float] = None
+    created_at: datetime
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import AbstractContextManager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from config.settings import settings
+from llms.model_registry import get_min_completion_tokens
+
+logger = logging.getLogger(__name__)
+
+# Fallback completion tokens per sample before any run has been observed
+DEFAULT_TOKENS_PER_SAMPLE: Dict[str, int] = {
+    "text": 250,
+    "json": 150,
+    "tabular": 60,
+    "code": 400,
+    "reasoning": 600,
+}
+# Fixed completion overhead per call (list brackets, separators, stray prose)
+CALL_OVERHEAD_TOKENS = 32
+# Smallest max_tokens ever requested, so tiny requests are not starved
+MIN_MAX_TOKENS = 256
+# How long learned averages loaded from the database stay fresh
+HISTORY_TTL_SECONDS = 300
+
+StatsKey = Tuple[str, str, str]
+
+
+def schema_fingerprint(schema: Optional[Dict[str, Any]]) -> str:
+    """Stable short hash of a JSON schema, empty string when there is none."""
+    if not schema:
+        return ""
+    canonical = json.dumps(schema, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _count_schema_leaves(schema: Any) -> int:
+    if not isinstance(schema, dict):
+        return 0
+    if "properties" in schema:
+        return sum(max(1, _count_schema_leaves(v)) for v in schema["properties"].values())
+    if "items" in schema:
+        return _count_schema_leaves(schema["items"])
+    return 0
+
+
+class TokenPlan(BaseModel):
+    tokens_per_sample: float
+    samples_per_call: List[int]
+    max_tokens: List[int]
+    source: str
+
+
+class TokenEstimator:
+    """
+    Learns average completion tokens per sample for each
+    (model, data_type, schema) and sizes max_tokens and the split of samples
+    across calls so completions fit without wasting budget.
+    """
+    def __init__(self,
+                 repository_factory: Optional[Callable[[], AbstractContextManager]] = None,
+                 max_completion_tokens: Optional[int] = None,
+                 safety_margin: Optional[float] = None):
+        self.repository_factory = repository_factory
+        self.max_completion_tokens = max_completion_tokens or settings.MAX_COMPLETION_TOKENS
+        self.safety_margin = safety_margin or settings.TOKEN_BUDGET_SAFETY_MARGIN
+        # key -> (completion_tokens, samples, loaded_at)
+        self._stats: Dict[StatsKey, Tuple[int, int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _load_history(self, key: StatsKey) -> Tuple[int, int]:
+        if self.repository_factory is None:
+            return 0, 0
+        try:
+            with self.repository_factory() as repo:
+                return repo.get_token_stats(*key)
+        except Exception as e:
+            logger.warning(f"Could not load token history for {key}: {e}")
+            return 0, 0
+
+    def _observed(self, key: StatsKey) -> Tuple[int, int]:
+        with self._lock:
+            cached = self._stats.get(key)
+        if cached is not None and time.monotonic() - cached[2] < HISTORY_TTL_SECONDS:
+            return cached[0], cached[1]
+
+        tokens, samples = self._load_history(key)
+        with self._lock:
+            self._stats[key] = (tokens, samples, time.monotonic())
+        return tokens, samples
+
+    def tokens_per_sample(self, model_name: str, data_type: str, schema: Optional[Dict[str, Any]] = None) -> Tuple[float, str]:
+        """Return (estimated completion tokens per sample, where the estimate came from)."""
+        key = (model_name, data_type, schema_fingerprint(schema))
+        tokens, samples = self._observed(key)
+        if samples > 0 and tokens > 0:
+            return tokens / samples, "history"
+
+        estimate = DEFAULT_TOKENS_PER_SAMPLE.get(data_type.lower(), 250)
+        leaves = _count_schema_leaves(schema)
+        if leaves:
+            estimate = 20 + 15 * leaves
+        return float(estimate), "heuristic"
+
+    def plan(self, model_name: str, data_type: str, num_samples: int, schema: Optional[Dict[str, Any]] = None) -> TokenPlan:
+        per_sample, source = self.tokens_per_sample(model_name, data_type, schema)
+        budget_per_sample = per_sample * self.safety_margin
+
+        capacity = max(1, math.floor((self.max_completion_tokens - CALL_OVERHEAD_TOKENS) / budget_per_sample))
+        num_calls = math.ceil(num_samples / capacity)
+        # Balance samples across calls instead of leaving a tiny remainder call
+        base, extra = divmod(num_samples, num_calls)
+        split = [base + (1 if i < extra else 0) for i in range(num_calls)]
+
+        floor = max(MIN_MAX_TOKENS, get_min_completion_tokens(model_name))
+        max_tokens = [
+            min(self.max_completion_tokens, max(floor, math.ceil(n * budget_per_sample + CALL_OVERHEAD_TOKENS)))
+            for n in split
+        ]
+        return TokenPlan(tokens_per_sample=per_sample, samples_per_call=split, max_tokens=max_tokens, source=source)
+
+    def record(self, model_name: str, data_type: str, schema: Optional[Dict[str, Any]], completion_tokens: int, num_samples: int):
+        """
+        Fold a completed, untruncated call into the running average. Only
+        updates memory: callers run on the event loop, so history is loaded
+        by plan() alone. A key not loaded yet starts stale, so the next plan()
+        still reads the database.
+        """
+        if completion_tokens <= 0 or num_samples <= 0:
+            return
+        key = (model_name, data_type, schema_fingerprint(schema))
+        with self._lock:
+            tokens, samples, loaded_at = self._stats.get(key, (0, 0, float("-inf")))
+            self._stats[key] = (tokens + completion_tokens, samples + num_samples, loaded_at)
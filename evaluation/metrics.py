@@ -1,6 +1,11 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Sequence
+import hashlib
 import json
+import numpy as np
+import pandas as pd
 from jsonschema import validate, ValidationError
+from jsonschema.validators import validator_for
+from core.executor import StageExecutor, get_executor
 
 def validate_json_schema(data: Any, schema: Dict[str, Any]) -> bool:
     """
@@ -12,9 +17,115 @@ def validate_json_schema(data: Any, schema: Dict[str, Any]) -> bool:
     except ValidationError:
         return False
 
+def _validate_chunk(contents: Sequence[Any], schema: Dict[str, Any]) -> List[bool]:
+    # Compile the schema once per chunk instead of once per sample
+    validator = validator_for(schema)(schema)
+    return [validator.is_valid(c) for c in contents]
+
+def validate_json_schema_batch(contents: Sequence[Any], schema: Dict[str, Any], executor: Optional[StageExecutor] = None) -> List[bool]:
+    """
+    Validate many instances against one JSON schema, fanning large batches
+    out over the post-processing executor.
+    """
+    executor = executor or get_executor()
+    return executor.map_chunks(_validate_chunk, list(contents), schema)
+
+def _hash_chunk(contents: Sequence[Any]) -> List[str]:
+    return [
+        hashlib.blake2b(
+            (json.dumps(c, sort_keys=True, separators=(",", ":"), default=str) if isinstance(c, (dict, list)) else str(c)).encode("utf-8"),
+            digest_size=16
+        ).hexdigest()
+        for c in contents
+    ]
+
+def content_hashes(contents: Sequence[Any], executor: Optional[StageExecutor] = None) -> List[str]:
+    """
+    Stable per-sample content hashes (key order independent) for dedup.
+    """
+    executor = executor or get_executor()
+    return executor.map_chunks(_hash_chunk, list(contents))
+
 def calculate_diversity_score(samples: List[str]) -> float:
     """
-    Placeholder for diversity metric (e.g. self-BLEU or embedding distance).
-    For now, returns 0.0.
+    Fraction of distinct samples by content hash (1.0 = no exact duplicates).
+    A cheap proxy until an embedding-based metric exists.
     """
-    return 0.0
+    if not samples:
+        return 0.0
+    return len(set(content_hashes(samples))) / len(samples)
+
+def _ks_statistic(a: np.ndarray, b: np.ndarray) -> float:
+    """Two-sample Kolmogorov-Smirnov statistic."""
+    a = np.sort(a)
+    b = np.sort(b)
+    grid = np.concatenate([a, b])
+    cdf_a = np.searchsorted(a, grid, side="right") / len(a)
+    cdf_b = np.searchsorted(b, grid, side="right") / len(b)
+    return float(np.max(np.abs(cdf_a - cdf_b)))
+
+def calculate_fidelity_metrics(seed: pd.DataFrame, synthetic: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Compare amplified tabular data against the seed it was fitted on.
+    Numeric columns report mean/std drift and the KS statistic, categorical
+    columns the total variation distance, and numeric column pairs the mean
+    absolute difference between correlation matrices. `column_fidelity` is
+    1 minus the average per-column distance (1.0 = indistinguishable).
+    """
+    columns: Dict[str, Dict[str, Any]] = {}
+    distances = []
+    numeric_cols = []
+
+    for col in seed.columns:
+        if col not in synthetic.columns:
+            columns[col] = {"missing": True}
+            distances.append(1.0)
+            continue
+
+        s = seed[col].dropna()
+        g = synthetic[col].dropna()
+        if s.empty or g.empty:
+            continue
+
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s) and pd.api.types.is_numeric_dtype(g):
+            numeric_cols.append(col)
+            s_arr = s.to_numpy(dtype=np.float64)
+            g_arr = g.to_numpy(dtype=np.float64)
+            ks = _ks_statistic(s_arr, g_arr)
+            seed_std = float(s_arr.std())
+            columns[col] = {
+                "type": "numeric",
+                "seed_mean": float(s_arr.mean()),
+                "synthetic_mean": float(g_arr.mean()),
+                "std_ratio": float(g_arr.std() / seed_std) if seed_std > 0 else None,
+                "ks_statistic": ks,
+            }
+            distances.append(ks)
+        else:
+            seed_freq = s.astype(str).value_counts(normalize=True)
+            synth_freq = g.astype(str).value_counts(normalize=True)
+            tv = float(0.5 * seed_freq.subtract(synth_freq, fill_value=0.0).abs().sum())
+            columns[col] = {
+                "type": "categorical",
+                "seed_categories": int(len(seed_freq)),
+                "synthetic_categories": int(len(synth_freq)),
+                "total_variation": tv,
+            }
+            distances.append(tv)
+
+    correlation_mae = None
+    if len(numeric_cols) > 1:
+        seed_corr = seed[numeric_cols].astype(float).corr().to_numpy()
+        synth_corr = synthetic[numeric_cols].astype(float).corr().to_numpy()
+        mask = ~np.eye(len(numeric_cols), dtype=bool)
+        diff = np.abs(seed_corr - synth_corr)[mask]
+        diff = diff[~np.isnan(diff)]
+        correlation_mae = float(diff.mean()) if diff.size else None
+
+    return {
+        "seed_rows": int(len(seed)),
+        "synthetic_rows": int(len(synthetic)),
+        "column_fidelity": float(1.0 - np.mean(distances)) if distances else None,
+        "correlation_mae": correlation_mae,
+        "columns": columns,
+    }
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from pydantic import BaseModel, Field
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Serialises version numbering between concurrent writers in this process
+_version_lock = threading.Lock()
+
+MANIFEST_SUFFIX = ".json"
+DIFF_SUFFIX = ".diff.json"
+
+
+class Partition(BaseModel):
+    """An immutable JSONL object holding a contiguous slice of one run's samples."""
+    hash: str
+    run_id: str
+    index: int
+    rows: int
+    bytes: int
+
+
+class DatasetManifest(BaseModel):
+    dataset: str
+    version: int
+    parent: Optional[int] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    partitions: List[Partition] = Field(default_factory=list)
+
+    @property
+    def run_ids(self) -> List[str]:
+        return list(dict.fromkeys(p.run_id for p in self.partitions))
+
+    @property
+    def rows(self) -> int:
+        return sum(p.rows for p in self.partitions)
+
+
+class ManifestDiff(BaseModel):
+    """
+    Objects a consumer at `from_version` must fetch or drop to reach
+    `to_version`. Partitions are compared by content hash.
+    """
+    dataset: str
+    from_version: Optional[int]
+    to_version: int
+    added: List[Partition] = Field(default_factory=list)
+    removed: List[Partition] = Field(default_factory=list)
+    unchanged: int = 0
+
+
+def diff_manifests(old: Optional[DatasetManifest], new: DatasetManifest) -> ManifestDiff:
+    old_partitions = {p.hash: p for p in old.partitions} if old else {}
+    new_partitions = {p.hash: p for p in new.partitions}
+    return ManifestDiff(
+        dataset=new.dataset,
+        from_version=old.version if old else None,
+        to_version=new.version,
+        added=[p for h, p in new_partitions.items() if h not in old_partitions],
+        removed=[p for h, p in old_partitions.items() if h not in new_partitions],
+        unchanged=sum(1 for h in new_partitions if h in old_partitions)
+    )
+
+
+def _serialize(contents: Sequence[Any]) -> bytes:
+    # Same line format as export_to_jsonl, so objects are directly consumable
+    return "".join(json.dumps({"content": c}, default=str) + "\n" for c in contents).encode("utf-8")
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class DatasetStore:
+    """
+    Versioned datasets grouping generation runs. Samples are stored once in
+    content-addressed JSONL partitions (objects/<sha256>.jsonl); each version
+    is a manifest listing its partitions. Creating a version only writes
+    partitions that do not exist yet, plus the manifest and its diff against
+    the parent, so consumers can sync incrementally.
+
+    Layout: <root>/<dataset>/objects/<hash[:2]>/<hash>.jsonl
+            <root>/<dataset>/versions/<version>.json (+ .diff.json)
+    """
+    def __init__(self, root: Optional[str] = None, partition_rows: Optional[int] = None):
+        self.root = Path(root or settings.DATASETS_DIR)
+        self.partition_rows = partition_rows or settings.DATASET_PARTITION_ROWS
+
+    def _dataset_dir(self, dataset: str) -> Path:
+        if not dataset or "/" in dataset or "\\" in dataset or dataset.startswith("."):
+            raise ValueError(f"Invalid dataset name: {dataset!r}")
+        return self.root / dataset
+
+    def object_path(self, dataset: str, digest: str) -> Path:
+        return self._dataset_dir(dataset) / "objects" / digest[:2] / f"{digest}.jsonl"
+
+    def _manifest_path(self, dataset: str, version: int) -> Path:
+        return self._dataset_dir(dataset) / "versions" / f"{version:06d}{MANIFEST_SUFFIX}"
+
+    def list_versions(self, dataset: str) -> List[int]:
+        versions_dir = self._dataset_dir(dataset) / "versions"
+        if not versions_dir.exists():
+            return []
+        return sorted(
+            int(p.name[:-len(MANIFEST_SUFFIX)]) for p in versions_dir.iterdir()
+            if p.name.endswith(MANIFEST_SUFFIX) and not p.name.endswith(DIFF_SUFFIX)
+        )
+
+    def get_manifest(self, dataset: str, version: Optional[int] = None) -> Optional[DatasetManifest]:
+        """The given version's manifest, or the latest when `version` is None."""
+        if version is None:
+            versions = self.list_versions(dataset)
+            if not versions:
+                return None
+            version = versions[-1]
+        path = self._manifest_path(dataset, version)
+        if not path.exists():
+            raise ValueError(f"Dataset {dataset} has no version {version}")
+        return DatasetManifest.model_validate_json(path.read_text())
+
+    def _write_partitions(self, dataset: str, run_id: str, contents: Sequence[Any]) -> Tuple[List[Partition], int]:
+        partitions = []
+        written = 0
+        for index, start in enumerate(range(0, len(contents), self.partition_rows)):
+            rows = contents[start:start + self.partition_rows]
+            data = _serialize(rows)
+            digest = hashlib.sha256(data).hexdigest()
+            path = self.object_path(dataset, digest)
+            if not path.exists():
+                _write_atomic(path, data)
+                written += 1
+            partitions.append(Partition(hash=digest, run_id=run_id, index=index, rows=len(rows), bytes=len(data)))
+        return partitions, written
+
+    def create_version(self,
+                       dataset: str,
+                       add_runs: Iterable[Tuple[str, Sequence[Any]]] = (),
+                       remove_runs: Iterable[str] = ()) -> Tuple[DatasetManifest, ManifestDiff]:
+        """
+        Create the next version from the latest one: partitions of runs in
+        `add_runs` ((run_id, sample contents) pairs) replace any existing
+        partitions of those runs, and runs in `remove_runs` are dropped.
+        Returns the new manifest and its diff against the parent.
+        """
+        remove = set(remove_runs)
+        new_partitions: Dict[str, List[Partition]] = {}
+        written = 0
+        # Objects are content-addressed, so writing them needs no coordination
+        for run_id, contents in add_runs:
+            new_partitions[run_id], count = self._write_partitions(dataset, run_id, list(contents))
+            written += count
+
+        with _version_lock:
+            return self._commit_version(dataset, new_partitions, remove, written)
+
+    def _commit_version(self,
+                        dataset: str,
+                        new_partitions: Dict[str, List[Partition]],
+                        remove: Set[str],
+                        written: int) -> Tuple[DatasetManifest, ManifestDiff]:
+        parent = self.get_manifest(dataset)
+        partitions = [
+            p for p in (parent.partitions if parent else [])
+            if p.run_id not in remove and p.run_id not in new_partitions
+        ]
+        for run_id, run_partitions in new_partitions.items():
+            if run_id not in remove:
+                partitions.extend(run_partitions)
+
+        manifest = DatasetManifest(
+            dataset=dataset,
+            version=(parent.version + 1) if parent else 1,
+            parent=parent.version if parent else None,
+            partitions=partitions
+        )
+        diff = diff_manifests(parent, manifest)
+
+        # Objects first, then the diff, then the manifest: a version is only visible once complete
+        path = self._manifest_path(dataset, manifest.version)
+        _write_atomic(path.with_name(f"{manifest.version:06d}{DIFF_SUFFIX}"), diff.model_dump_json(indent=2).encode("utf-8"))
+        _write_atomic(path, manifest.model_dump_json(indent=2).encode("utf-8"))
+        logger.info(
+            f"Dataset {dataset} v{manifest.version}: {len(diff.added)} partitions added "
+            f"({written} new objects), {len(diff.removed)} removed, {diff.unchanged} unchanged"
+        )
+        return manifest, diff
+
+    def diff(self, dataset: str, from_version: Optional[int], to_version: Optional[int] = None) -> ManifestDiff:
+        """Diff between two versions; `from_version` None means from empty."""
+        new = self.get_manifest(dataset, to_version)
+        if new is None:
+            raise ValueError(f"Dataset {dataset} has no versions")
+        old = self.get_manifest(dataset, from_version) if from_version is not None else None
+        return diff_manifests(old, new)
+
+    def export_delta(self,
+                     dataset: str,
+                     from_version: Optional[int],
+                     to_version: Optional[int] = None,
+                     dest: Optional[str] = None) -> str:
+        """
+        Write a directory holding only the partitions added since
+        `from_version` (all of them when None), plus the target manifest and
+        the diff, for consumers to apply onto their copy.
+        """
+        diff = self.diff(dataset, from_version, to_version)
+        manifest = self.get_manifest(dataset, diff.to_version)
+        since = f"v{from_version}" if from_version is not None else "v0"
+        out = Path(dest or f"delta_{dataset}_{since}_v{diff.to_version}")
+        if out.exists():
+            shutil.rmtree(out)
+        for partition in diff.added:
+            target = out / "objects" / partition.hash[:2] / f"{partition.hash}.jsonl"
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(self.object_path(dataset, partition.hash), target)
+        _write_atomic(out / "manifest.json", manifest.model_dump_json(indent=2).encode("utf-8"))
+        _write_atomic(out / "diff.json", diff.model_dump_json(indent=2).encode("utf-8"))
+        return str(out)
+
+    def iter_contents(self, dataset: str, version: Optional[int] = None) -> Iterable[Any]:
+        """Stream every sample of a version in manifest order."""
+        manifest = self.get_manifest(dataset, version)
+        if manifest is None:
+            return
+        for partition in manifest.partitions:
+            with open(self.object_path(dataset, partition.hash)) as f:
+                for line in f:
+                    yield json.loads(line)["content"]
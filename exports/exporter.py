@@ -1,34 +1,100 @@
 import pandas as pd
 import json
-from typing import List, Union
+from typing import List, Union, Iterable, Optional, Callable
+from core.batch import SampleBatch, SharedBatch, SharedBatchChunk, RECORDS
+from core.executor import StageExecutor, get_executor
 from core.schemas import GenerationResult, GeneratedSample
 
-def export_to_csv(result: GenerationResult) -> str:
-    data = []
-    for s in result.samples:
-        if isinstance(s.content, dict):
-             data.append(s.content)
-        elif isinstance(s.content, str):
-             data.append({"content": s.content})
-        else:
-             data.append({"content": str(s.content)})
-             
-    df = pd.DataFrame(data)
+def _csv_chunks(chunks: List[SharedBatchChunk]) -> List[str]:
+    texts = []
+    for chunk in chunks:
+        with chunk.open() as batch:
+            texts.append(batch.to_dataframe().to_csv(index=False, header=chunk.start == 0))
+    return texts
+
+def _jsonl_chunks(chunks: List[SharedBatchChunk]) -> List[str]:
+    texts = []
+    for chunk in chunks:
+        with chunk.open() as batch:
+            texts.append("".join(json.dumps({"content": c}, default=str) + "\n" for c in batch.iter_contents()))
+    return texts
+
+def _write_parallel(filename: str, batch: SampleBatch, serialize: Callable[[List[SharedBatchChunk]], List[str]], executor: StageExecutor):
+    """Serialise row ranges in worker processes that read typed columns from shared memory."""
+    with SharedBatch(batch) as shared:
+        chunks = [shared.chunk(start, stop) for start, stop in executor.ranges(len(batch))]
+        texts = executor.map_chunks(serialize, chunks, parallel=True)
+    with open(filename, "w", newline="") as f:
+        for text in texts:
+            f.write(text)
+
+def export_to_csv(result: GenerationResult, executor: Optional[StageExecutor] = None) -> str:
+    executor = executor or get_executor()
     filename = f"export_{result.request_id}.csv"
+    # Only record batches have a fixed column set that every chunk agrees on
+    if result.samples.kind == RECORDS and executor.should_parallelize(len(result.samples)):
+        _write_parallel(filename, result.samples, _csv_chunks, executor)
+        return filename
+    df = result.samples.to_dataframe()
     df.to_csv(filename, index=False)
     return filename
 
 def export_to_json(result: GenerationResult) -> str:
-    data = [s.dict() for s in result.samples]
+    data = result.samples.to_records()
     filename = f"export_{result.request_id}.json"
     with open(filename, "w") as f:
         json.dump(data, f, indent=2, default=str)
     return filename
 
-def export_to_jsonl(result: GenerationResult) -> str:
+def export_to_jsonl(result: GenerationResult, executor: Optional[StageExecutor] = None) -> str:
+    executor = executor or get_executor()
     filename = f"export_{result.request_id}.jsonl"
+    if executor.should_parallelize(len(result.samples)):
+        _write_parallel(filename, result.samples, _jsonl_chunks, executor)
+        return filename
     with open(filename, "w") as f:
-        for s in result.samples:
-            json.dump(s.dict(), f, default=str)
+        for content in result.samples.iter_contents():
+            json.dump({"content": content}, f, default=str)
             f.write("\n")
     return filename
+
+def _frame_csv(frames: List[pd.DataFrame]) -> List[str]:
+    return [df.to_csv(index=False, header=False) for df in frames]
+
+def _frame_jsonl(frames: List[pd.DataFrame]) -> List[str]:
+    texts = []
+    for df in frames:
+        text = df.to_json(orient="records", lines=True)
+        texts.append(text if text.endswith("\n") else text + "\n")
+    return texts
+
+def _serialize_frame(df: pd.DataFrame, serialize: Callable[[List[pd.DataFrame]], List[str]], executor: StageExecutor) -> List[str]:
+    """Serialise one batch, split over the pool's workers when it is large enough."""
+    if not executor.should_parallelize(len(df)):
+        return serialize([df])
+    frames = [df.iloc[start:stop] for start, stop in executor.ranges(len(df))]
+    return executor.map_chunks(serialize, frames, parallel=True)
+
+def export_batches_to_csv(request_id: str, batches: Iterable[pd.DataFrame], executor: Optional[StageExecutor] = None) -> str:
+    """Stream DataFrame batches into a single CSV without holding them all in memory."""
+    executor = executor or get_executor()
+    filename = f"export_{request_id}.csv"
+    with open(filename, "w", newline="") as f:
+        for i, df in enumerate(batches):
+            if i == 0:
+                f.write(df.iloc[:0].to_csv(index=False))
+            for text in _serialize_frame(df, _frame_csv, executor):
+                f.write(text)
+    return filename
+
+def export_batches_to_jsonl(request_id: str, batches: Iterable[pd.DataFrame], executor: Optional[StageExecutor] = None) -> str:
+    """Stream DataFrame batches into a single JSONL file, one row per line."""
+    executor = executor or get_executor()
+    filename = f"export_{request_id}.jsonl"
+    with open(filename, "w") as f:
+        for df in batches:
+            if df.empty:
+                continue
+            for text in _serialize_frame(df, _frame_jsonl, executor):
+                f.write(text)
+    return filename
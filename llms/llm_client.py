@@ -1,76 +1,226 @@
+import asyncio
 import logging
-from typing import List, Dict, Optional, Any, Union
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Any, Union, Tuple
 import google.generativeai as genai
-from openai import OpenAI, APIError, APITimeoutError, RateLimitError
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from openai import OpenAI, AsyncOpenAI
 from config.settings import settings
+from llms.model_health import get_health_registry
 from llms.model_registry import LLMProvider, get_model_provider
+from llms.resilience import get_call_breakers, provider_retry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# AsyncOpenAI clients are bound to the event loop they first run on, so they are
+# shared per loop: every coroutine on a loop reuses one connection pool per provider.
+_async_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], AsyncOpenAI]]" = weakref.WeakKeyDictionary()
+
+def _shared_async_openai(base_url: str, api_key: str) -> AsyncOpenAI:
+    loop = asyncio.get_running_loop()
+    clients = _async_openai_clients.setdefault(loop, {})
+    key = (base_url, api_key)
+    if key not in clients:
+        clients[key] = AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0)
+    return clients[key]
+
+# Message key marking the end of a stable prompt prefix. Providers with explicit
+# prompt caching get a cache breakpoint there; the key is never sent as-is.
+CACHE_BREAKPOINT = "cache_breakpoint"
+
+# OpenRouter model families that only cache prompts at explicit cache_control breakpoints
+# (OpenAI-style models cache repeated prefixes automatically)
+EXPLICIT_CACHE_MODEL_PREFIXES = ("anthropic/", "google/gemini")
+
+@dataclass
+class LLMResponse:
+    content: str
+    usage: Dict[str, int] = field(default_factory=dict)
+    finish_reason: Optional[str] = None
+
 class UnifiedLLMClient:
     """Interface for LLM clients."""
+    model_name: str
+    # Circuit breakers are shared by every client of the same provider (and model)
+    provider: str
+
+    def _record_call(self, started: float, response: Optional[LLMResponse] = None):
+        # Every attempt, failed or not, feeds the model health registry
+        get_health_registry().record_call(
+            self.model_name,
+            time.monotonic() - started,
+            completion_tokens=response.usage.get("completion_tokens", 0) if response else 0,
+            error=response is None
+        )
+
+    def complete(
+        self,
+        messages: List[Dict[str, Any]],
+        json_mode: bool = False,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> LLMResponse:
+        raise NotImplementedError
+
+    async def acomplete(
+        self,
+        messages: List[Dict[str, Any]],
+        json_mode: bool = False,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> LLMResponse:
+        raise NotImplementedError
+
     def generate(
         self,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
         json_mode: bool = False,
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
     ) -> str:
-        raise NotImplementedError
+        return self.complete(messages, json_mode, temperature, max_tokens).content
+
+    async def agenerate(
+        self,
+        messages: List[Dict[str, Any]],
+        json_mode: bool = False,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        return (await self.acomplete(messages, json_mode, temperature, max_tokens)).content
 
 class OpenAICompatibleClient(UnifiedLLMClient):
-    def __init__(self, model_name: str, base_url: str, api_key: str, temperature: float = 0.7, max_tokens: Optional[int] = None):
+    def __init__(self, model_name: str, base_url: str, api_key: str, temperature: float = 0.7, max_tokens: Optional[int] = None,
+                 provider: Optional[str] = None):
         if not api_key:
             logger.warning(f"API key missing for model {model_name} (Base URL: {base_url})")
             
-        self.client = OpenAI(
-            base_url=base_url,
-            api_key=api_key,
-        )
+        self.provider = provider or base_url
+        self.base_url = base_url
+        self.api_key = api_key
+        self._client: Optional[OpenAI] = None
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
 
-    @retry(
-        retry=retry_if_exception_type((APITimeoutError, RateLimitError, APIError)),
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10)
-    )
-    def generate(
+    @property
+    def client(self) -> OpenAI:
+        # Created lazily so async-only callers never open a sync connection pool
+        if self._client is None:
+            self._client = OpenAI(base_url=self.base_url, api_key=self.api_key, max_retries=0)
+        return self._client
+
+    def _build_params(
         self,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
+        json_mode: bool,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+    ) -> Dict[str, Any]:
+        params: Dict[str, Any] = {
+            "model": self.model_name,
+            "messages": self._format_messages(messages),
+            "temperature": temperature if temperature is not None else self.temperature,
+        }
+        
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+        elif self.max_tokens is not None:
+            params["max_tokens"] = self.max_tokens
+
+        if json_mode:
+            params["response_format"] = {"type": "json_object"}
+        return params
+
+    def _format_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        explicit_cache = (
+            self.provider == LLMProvider.OPENROUTER.value
+            and self.model_name.startswith(EXPLICIT_CACHE_MODEL_PREFIXES)
+        )
+        formatted = []
+        for msg in messages:
+            msg = dict(msg)
+            if msg.pop(CACHE_BREAKPOINT, False) and explicit_cache:
+                msg["content"] = [{"type": "text", "text": msg["content"], "cache_control": {"type": "ephemeral"}}]
+            formatted.append(msg)
+        return formatted
+
+    @staticmethod
+    def _to_response(response: Any) -> LLMResponse:
+        usage = {}
+        if response.usage is not None:
+            details = getattr(response.usage, "prompt_tokens_details", None)
+            # OpenAI-style prompt_tokens_details, or DeepSeek's prompt_cache_hit_tokens
+            cached = getattr(details, "cached_tokens", None) or getattr(response.usage, "prompt_cache_hit_tokens", None)
+            usage = {
+                "prompt_tokens": response.usage.prompt_tokens or 0,
+                "completion_tokens": response.usage.completion_tokens or 0,
+                "cached_tokens": cached or 0,
+            }
+
+        content = response.choices[0].message.content
+        finish_reason = response.choices[0].finish_reason
+        if not content:
+            # Reasoning models can spend the whole budget thinking; callers may retry with more
+            if finish_reason == "length":
+                return LLMResponse(content="", usage=usage, finish_reason=finish_reason)
+            raise ValueError("Received empty response from LLM")
+            
+        return LLMResponse(content=content, usage=usage, finish_reason=finish_reason)
+
+    @provider_retry()
+    def complete(
+        self,
+        messages: List[Dict[str, Any]],
         json_mode: bool = False,
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
-    ) -> str:
+    ) -> LLMResponse:
+        breaker = get_call_breakers(self.provider, self.model_name)
+        breaker.before_call()
+        started = time.monotonic()
         try:
-            params: Dict[str, Any] = {
-                "model": self.model_name,
-                "messages": messages,
-                "temperature": temperature if temperature is not None else self.temperature,
-            }
-            
-            if max_tokens is not None:
-                params["max_tokens"] = max_tokens
-            elif self.max_tokens is not None:
-                params["max_tokens"] = self.max_tokens
-
-            if json_mode:
-                params["response_format"] = {"type": "json_object"}
-
+            params = self._build_params(messages, json_mode, temperature, max_tokens)
             logger.info(f"Generating with model {self.model_name} via OpenAI compatible client...")
             response = self.client.chat.completions.create(**params)
-            
-            content = response.choices[0].message.content
-            if not content:
-                raise ValueError("Received empty response from LLM")
-                
-            return content
+            result = self._to_response(response)
+            breaker.record()
+            self._record_call(started, result)
+            return result
+
+        except Exception as e:
+            breaker.record(e)
+            self._record_call(started)
+            logger.error(f"Error executing LLM call: {e}")
+            raise
+
+    @provider_retry()
+    async def acomplete(
+        self,
+        messages: List[Dict[str, Any]],
+        json_mode: bool = False,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> LLMResponse:
+        breaker = get_call_breakers(self.provider, self.model_name)
+        breaker.before_call()
+        started = time.monotonic()
+        try:
+            params = self._build_params(messages, json_mode, temperature, max_tokens)
+            logger.info(f"Generating with model {self.model_name} via async OpenAI compatible client...")
+            client = _shared_async_openai(self.base_url, self.api_key)
+            response = await client.chat.completions.create(**params)
+            result = self._to_response(response)
+            breaker.record()
+            self._record_call(started, result)
+            return result
 
         except Exception as e:
+            breaker.record(e)
+            self._record_call(started)
             logger.error(f"Error executing LLM call: {e}")
             raise
 
@@ -80,6 +230,7 @@ class GoogleClient(UnifiedLLMClient):
             logger.warning(f"API key missing for Google model {model_name}")
         
         genai.configure(api_key=api_key)
+        self.provider = LLMProvider.GOOGLE.value
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
@@ -91,68 +242,131 @@ class GoogleClient(UnifiedLLMClient):
         )
         self.model = genai.GenerativeModel(model_name=model_name)
 
-    @retry(
-        retry=retry_if_exception_type(Exception), # Broad retry for now, narrow down later
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10)
-    )
-    def generate(
+    def _prepare(
+        self,
+        messages: List[Dict[str, Any]],
+        json_mode: bool,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+    ) -> Tuple[Any, str, Any]:
+        # Convert messages to Google format
+        # Google Generative AI supports a list of content dicts or chat history.
+        # Simple conversion: 
+        # System prompt -> configuration or separate handling (Google system instructions)
+        # User/Assistant -> history
+        
+        system_instruction = None
+        history = []
+        last_user_message = ""
+        
+        for msg in messages:
+            role = msg["role"]
+            content = msg["content"]
+            if role == "system":
+                system_instruction = content
+            elif role == "user":
+                last_user_message = content # We'll send the last one as the triggers
+            elif role == "assistant":
+                # For history, Google expects 'user' or 'model' roles
+                history.append({"role": "model", "parts": [content]})
+                
+            # Note: This is a simplified chat conversion. 
+            # Ideally we build a chat session if there's history, but for single generate call:
+        
+        # A per-call model carries the system instruction, so concurrent calls never share it
+        model = self.model
+        if system_instruction:
+            model = genai.GenerativeModel(model_name=self.model_name, system_instruction=system_instruction)
+        
+        # Override config if needed
+        current_config = self.generation_config
+        if temperature is not None or max_tokens is not None:
+            current_config = genai.types.GenerationConfig(
+                temperature=temperature if temperature is not None else self.temperature,
+                max_output_tokens=max_tokens if max_tokens is not None else self.max_tokens,
+                response_mime_type="application/json" if json_mode else "text/plain"
+            )
+        elif json_mode:
+            current_config = genai.types.GenerationConfig(
+                temperature=self.temperature,
+                max_output_tokens=self.max_tokens,
+                response_mime_type="application/json"
+            )
+        return model, last_user_message, current_config
+
+    @staticmethod
+    def _to_response(response: Any) -> LLMResponse:
+        usage = {}
+        usage_metadata = getattr(response, "usage_metadata", None)
+        if usage_metadata is not None:
+            usage = {
+                "prompt_tokens": usage_metadata.prompt_token_count or 0,
+                "completion_tokens": usage_metadata.candidates_token_count or 0,
+                "cached_tokens": getattr(usage_metadata, "cached_content_token_count", 0) or 0,
+            }
+        finish_reason = None
+        if response.candidates:
+            # Normalise Google's MAX_TOKENS to the OpenAI-style "length"
+            reason = response.candidates[0].finish_reason
+            finish_reason = "length" if getattr(reason, "name", str(reason)) == "MAX_TOKENS" else "stop"
+        try:
+            content = response.text
+        except ValueError:
+            # No text parts: a MAX_TOKENS stop with nothing emitted yet is reported as truncation
+            if finish_reason != "length":
+                raise
+            content = ""
+        return LLMResponse(content=content, usage=usage, finish_reason=finish_reason)
+
+    @provider_retry()
+    def complete(
         self,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
         json_mode: bool = False,
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
-    ) -> str:
+    ) -> LLMResponse:
+        breaker = get_call_breakers(self.provider, self.model_name)
+        breaker.before_call()
+        started = time.monotonic()
         try:
-            # Convert messages to Google format
-            # Google Generative AI supports a list of content dicts or chat history.
-            # Simple conversion: 
-            # System prompt -> configuration or separate handling (Google system instructions)
-            # User/Assistant -> history
-            
-            system_instruction = None
-            history = []
-            last_user_message = ""
-            
-            for msg in messages:
-                role = msg["role"]
-                content = msg["content"]
-                if role == "system":
-                    system_instruction = content
-                elif role == "user":
-                    last_user_message = content # We'll send the last one as the triggers
-                elif role == "assistant":
-                    # For history, Google expects 'user' or 'model' roles
-                    history.append({"role": "model", "parts": [content]})
-                    
-                # Note: This is a simplified chat conversion. 
-                # Ideally we build a chat session if there's history, but for single generate call:
-            
-            # Re-initializing model with system instruction if present
-            if system_instruction:
-                 self.model = genai.GenerativeModel(model_name=self.model_name, system_instruction=system_instruction)
-            
-            # Override config if needed
-            current_config = self.generation_config
-            if temperature is not None or max_tokens is not None:
-                current_config = genai.types.GenerationConfig(
-                    temperature=temperature if temperature is not None else self.temperature,
-                    max_output_tokens=max_tokens if max_tokens is not None else self.max_tokens,
-                    response_mime_type="application/json" if json_mode else "text/plain"
-                )
-            elif json_mode:
-                 current_config = genai.types.GenerationConfig(
-                    temperature=self.temperature,
-                    max_output_tokens=self.max_tokens,
-                    response_mime_type="application/json"
-                )
-
+            model, last_user_message, config = self._prepare(messages, json_mode, temperature, max_tokens)
             logger.info(f"Generating with model {self.model_name} via Google client...")
-            response = self.model.generate_content(last_user_message, generation_config=current_config)
+            response = model.generate_content(last_user_message, generation_config=config)
+            result = self._to_response(response)
+            breaker.record()
+            self._record_call(started, result)
+            return result
             
-            return response.text
+        except Exception as e:
+            breaker.record(e)
+            self._record_call(started)
+            logger.error(f"Error executing Google LLM call: {e}")
+            raise
+
+    @provider_retry()
+    async def acomplete(
+        self,
+        messages: List[Dict[str, Any]],
+        json_mode: bool = False,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> LLMResponse:
+        breaker = get_call_breakers(self.provider, self.model_name)
+        breaker.before_call()
+        started = time.monotonic()
+        try:
+            model, last_user_message, config = self._prepare(messages, json_mode, temperature, max_tokens)
+            logger.info(f"Generating with model {self.model_name} via async Google client...")
+            response = await model.generate_content_async(last_user_message, generation_config=config)
+            result = self._to_response(response)
+            breaker.record()
+            self._record_call(started, result)
+            return result
             
         except Exception as e:
+            breaker.record(e)
+            self._record_call(started)
             logger.error(f"Error executing Google LLM call: {e}")
             raise
 
@@ -167,7 +381,8 @@ class LLMClientFactory:
                 base_url=settings.OPENROUTER_BASE_URL,
                 api_key=settings.OPENROUTER_API_KEY,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                provider=LLMProvider.OPENROUTER.value
             )
         elif provider == LLMProvider.DEEPSEEK:
             return OpenAICompatibleClient(
@@ -175,7 +390,8 @@ class LLMClientFactory:
                 base_url=settings.DEEPSEEK_BASE_URL,
                 api_key=settings.DEEPSEEK_API_KEY,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                provider=LLMProvider.DEEPSEEK.value
             )
         elif provider == LLMProvider.NVIDIA:
             return OpenAICompatibleClient(
@@ -183,7 +399,8 @@ class LLMClientFactory:
                 base_url=settings.NVIDIA_BASE_URL,
                 api_key=settings.NVIDIA_API_KEY,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                provider=LLMProvider.NVIDIA.value
             )
         elif provider == LLMProvider.DASHSCOPE:
              return OpenAICompatibleClient(
@@ -191,7 +408,8 @@ class LLMClientFactory:
                 base_url=settings.DASHSCOPE_BASE_URL,
                 api_key=settings.DASHSCOPE_API_KEY,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                provider=LLMProvider.DASHSCOPE.value
             )
         elif provider == LLMProvider.GOOGLE:
             return GoogleClient(
@@ -211,7 +429,8 @@ class LLMClientFactory:
                     base_url=settings.OPENROUTER_BASE_URL,
                     api_key=settings.OPENROUTER_API_KEY,
                     temperature=temperature,
-                    max_tokens=max_tokens
+                    max_tokens=max_tokens,
+                    provider=LLMProvider.OPENROUTER.value
                 )
             raise ValueError(f"No provider configured for model {model_name}")
 
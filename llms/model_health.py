@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from contextlib import AbstractContextManager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+from pydantic import BaseModel, Field
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ModelHealth(BaseModel):
+    """Exponentially weighted view of how a model has behaved on recent calls."""
+    model_name: str
+    calls: int = 0
+    errors: int = 0
+    latency_ms: Optional[float] = None
+    error_rate: float = 0.0
+    tokens_per_sec: Optional[float] = None
+    judged_samples: int = 0
+    judge_pass_rate: Optional[float] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    def is_healthy(self) -> bool:
+        if self.error_rate <= settings.AUTO_MODEL_MAX_ERROR_RATE:
+            return True
+        # Auto never routes to an unhealthy model, so give it another chance once its stats go stale
+        return (datetime.utcnow() - self.updated_at).total_seconds() >= settings.AUTO_MODEL_RETRY_SECONDS
+
+    def meets_quality(self) -> bool:
+        # Models the judge has not seen yet get the benefit of the doubt
+        return self.judge_pass_rate is None or self.judge_pass_rate >= settings.AUTO_MODEL_MIN_PASS_RATE
+
+
+def _ewma(previous: Optional[float], value: float, alpha: float) -> float:
+    return value if previous is None else alpha * value + (1 - alpha) * previous
+
+
+class ModelHealthRegistry:
+    """
+    Tracks EWMA latency, error rate, throughput and judge pass rate per model
+    from real calls, and picks the model behind the "auto" option.
+
+    Stats are loaded from the database when the registry is created and
+    written back at most every HEALTH_FLUSH_SECONDS on a background thread,
+    so they survive restarts without a write per call or blocking callers
+    (which run on the event loop) on the database.
+    """
+    def __init__(self,
+                 repository_factory: Optional[Callable[[], AbstractContextManager]] = None,
+                 alpha: Optional[float] = None,
+                 flush_interval: Optional[float] = None):
+        self.repository_factory = repository_factory
+        self.alpha = alpha or settings.HEALTH_EWMA_ALPHA
+        self.flush_interval = flush_interval if flush_interval is not None else settings.HEALTH_FLUSH_SECONDS
+        self._health: Dict[str, ModelHealth] = {}
+        self._dirty: Dict[str, ModelHealth] = {}
+        self._last_flush = time.monotonic()
+        self._flushing = False
+        self._lock = threading.Lock()
+        # Serialises writes so an older snapshot never lands after a newer one
+        self._flush_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if self.repository_factory is None:
+            return
+        try:
+            with self.repository_factory() as repo:
+                for health in repo.get_model_health():
+                    self._health.setdefault(health.model_name, health)
+        except Exception as e:
+            logger.warning(f"Could not load model health: {e}")
+
+    def _entry(self, model_name: str) -> ModelHealth:
+        if model_name not in self._health:
+            self._health[model_name] = ModelHealth(model_name=model_name)
+        return self._health[model_name]
+
+    def record_call(self, model_name: str, latency: float, completion_tokens: int = 0, error: bool = False):
+        """Fold one provider call (successful or not) into the model's stats."""
+        with self._lock:
+            health = self._entry(model_name)
+            health.calls += 1
+            health.error_rate = _ewma(health.error_rate if health.calls > 1 else None, 1.0 if error else 0.0, self.alpha)
+            if error:
+                health.errors += 1
+            else:
+                health.latency_ms = _ewma(health.latency_ms, latency * 1000, self.alpha)
+                if completion_tokens > 0 and latency > 0:
+                    health.tokens_per_sec = _ewma(health.tokens_per_sec, completion_tokens / latency, self.alpha)
+            health.updated_at = datetime.utcnow()
+            self._dirty[model_name] = health.model_copy()
+        self._maybe_flush()
+
+    def record_judgement(self, model_name: str, passed: int, total: int):
+        """Fold the judge's verdicts on one batch of a model's samples into its pass rate."""
+        if total <= 0:
+            return
+        with self._lock:
+            health = self._entry(model_name)
+            health.judged_samples += total
+            health.judge_pass_rate = _ewma(health.judge_pass_rate, passed / total, self.alpha)
+            health.updated_at = datetime.utcnow()
+            self._dirty[model_name] = health.model_copy()
+        self._maybe_flush()
+
+    def get(self, model_name: str) -> ModelHealth:
+        with self._lock:
+            return self._entry(model_name).model_copy()
+
+    def snapshot(self) -> List[ModelHealth]:
+        with self._lock:
+            return [h.model_copy() for h in sorted(self._health.values(), key=lambda h: h.model_name)]
+
+    def select(self, candidates: Sequence[str]) -> str:
+        """
+        Pick the fastest healthy candidate that meets the quality floor.
+        Candidates without throughput data come next, in the order given, so
+        new models still get tried; if none qualify, the one with the lowest
+        error rate is used.
+        """
+        if not candidates:
+            raise ValueError("No candidate models to choose from")
+        with self._lock:
+            health = [self._entry(m).model_copy() for m in candidates]
+
+        eligible = [h for h in health if h.is_healthy() and h.meets_quality()]
+        measured = [h for h in eligible if h.tokens_per_sec is not None]
+        if measured:
+            return max(measured, key=lambda h: h.tokens_per_sec).model_name
+        if eligible:
+            return eligible[0].model_name
+        return min(health, key=lambda h: h.error_rate).model_name
+
+    def _maybe_flush(self):
+        with self._lock:
+            if self._flushing or time.monotonic() - self._last_flush < self.flush_interval:
+                return
+            self._flushing = True
+        threading.Thread(target=self._background_flush, name="model-health-flush", daemon=True).start()
+
+    def _background_flush(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._flushing = False
+
+    def flush(self):
+        """Persist stats changed since the last flush. Blocks on the database."""
+        with self._flush_lock:
+            with self._lock:
+                self._last_flush = time.monotonic()
+                pending, self._dirty = list(self._dirty.values()), {}
+            if not pending or self.repository_factory is None:
+                return
+            try:
+                with self.repository_factory() as repo:
+                    repo.save_model_health(pending)
+            except Exception as e:
+                logger.warning(f"Could not persist model health: {e}")
+                with self._lock:
+                    for health in pending:
+                        self._dirty.setdefault(health.model_name, health)
+
+
+_default_registry: Optional[ModelHealthRegistry] = None
+_default_lock = threading.Lock()
+
+
+def get_health_registry() -> ModelHealthRegistry:
+    """Process-wide registry fed by every LLM client call."""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = ModelHealthRegistry()
+        return _default_registry
+
+
+def set_health_registry(registry: ModelHealthRegistry):
+    """Replace the process-wide registry (e.g. one backed by the database)."""
+    global _default_registry
+    with _default_lock:
+        _default_registry = registry
@@ -1,5 +1,6 @@
 from enum import Enum
 from typing import Dict, Optional
+from config.settings import settings
 
 class LLMProvider(str, Enum):
     OPENROUTER = "openrouter"
@@ -30,6 +31,20 @@ class JudgeModels(str, Enum):
     LLAMA_3_1_405B = "meta-llama/llama-3.1-405b-instruct:free"
     HERMES_3_405B = "nousresearch/hermes-3-llama-3.1-405b:free"
 
+# Models that reason before answering. Their reasoning tokens count against
+# max_tokens, so a budget sized for the answer alone can end with no content.
+REASONING_MODELS = {
+    GeneratorModels.DEEPSEEK_R1.value,
+    GeneratorModels.DEEPSEEK_R1_CHIMERA.value,
+    GeneratorModels.LFM_2_5.value,
+    GeneratorModels.GPT_OSS_120B.value,
+    GeneratorModels.GPT_OSS_20B.value,
+    GeneratorModels.QWEN_3_4B.value,
+}
+
+# Generator option that routes each request to the best model right now (see llms/model_health.py)
+AUTO_MODEL = "auto"
+
 # Map friendly names to IDs if needed for UI
 MODEL_FRIENDLY_NAMES = {
     GeneratorModels.GPT_OSS_120B: "GPT OSS 120B",
@@ -57,6 +72,12 @@ MODEL_PROVIDER_MAP: Dict[str, LLMProvider] = {
 def get_model_name(model_enum: Enum) -> str:
     return MODEL_FRIENDLY_NAMES.get(model_enum, model_enum.value)
 
+def get_min_completion_tokens(model_id: str) -> int:
+    """Smallest max_tokens worth sending to a model, leaving room for reasoning."""
+    if model_id in REASONING_MODELS:
+        return settings.REASONING_MIN_COMPLETION_TOKENS
+    return 0
+
 def get_model_provider(model_id: str) -> Optional[LLMProvider]:
     """Get the provider for a given model ID."""
     # Check if it matches any known enum values
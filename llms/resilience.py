@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from google.api_core import exceptions as google_exceptions
+from openai import APIConnectionError, APIError, APIStatusError
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+GOOGLE_RETRYABLE = (
+    google_exceptions.ServerError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.DeadlineExceeded,
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    True for transient, provider-side failures (timeouts, connection errors,
+    rate limits, 5xx). Client errors such as bad requests or invalid keys
+    fail the same way on every attempt and are not retried.
+    """
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIError):
+        # No HTTP status: the provider reported an error in the response body
+        return True
+    return isinstance(error, GOOGLE_RETRYABLE)
+
+
+def is_unrecoverable(error: BaseException) -> bool:
+    """
+    True when further calls would fail the same way: the provider rejected
+    the request (bad key, bad request, unknown model) or the breaker is open.
+    """
+    if isinstance(error, CircuitOpenError):
+        return True
+    if isinstance(error, (APIStatusError, google_exceptions.GoogleAPICallError)):
+        return not is_retryable(error)
+    return False
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """
+    True when the provider as a whole failed (unreachable, timed out, 5xx).
+    Rate limits and errors reported for a request are specific to the model.
+    """
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, (google_exceptions.ServerError, google_exceptions.DeadlineExceeded))
+
+
+def provider_retry():
+    """
+    Retry decorator for provider calls: retryable errors only, with full
+    jitter so concurrent callers do not retry in lockstep.
+    """
+    return retry(
+        retry=retry_if_exception(is_retryable),
+        stop=stop_after_attempt(settings.LLM_RETRY_ATTEMPTS),
+        wait=wait_random_exponential(multiplier=settings.LLM_RETRY_BASE_SECONDS, max=settings.LLM_RETRY_MAX_SECONDS),
+        reraise=True
+    )
+
+
+class CircuitBreaker:
+    """
+    After `failure_threshold` consecutive failures (errors `is_failure`
+    accepts) the breaker opens and calls fail fast with CircuitOpenError;
+    after `reset_timeout` seconds one trial call is let through (half-open)
+    and its outcome closes or re-opens the breaker.
+    """
+    def __init__(self,
+                 name: str,
+                 failure_threshold: Optional[int] = None,
+                 reset_timeout: Optional[float] = None,
+                 is_failure: Callable[[BaseException], bool] = is_retryable):
+        self.name = name
+        self.is_failure = is_failure
+        self.failure_threshold = failure_threshold or settings.BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or settings.BREAKER_RESET_SECONDS
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.rejected_calls = 0
+        self.opened_at: Optional[float] = None
+        self._trial_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go to the provider now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                logger.info(f"Circuit breaker for {self.name} is half-open, sending a trial call")
+            # A trial that never reported back (e.g. was cancelled) is replaced after reset_timeout
+            if self.state == HALF_OPEN and (
+                self._trial_started is None or time.monotonic() - self._trial_started >= self.reset_timeout
+            ):
+                self._trial_started = time.monotonic()
+                return
+            self.rejected_calls += 1
+        raise CircuitOpenError(f"{self.name} is unavailable (circuit breaker open)")
+
+    def record(self, error: Optional[BaseException] = None):
+        """Record a call's outcome. Errors that are not failures mean the call was answered."""
+        with self._lock:
+            self._trial_started = None
+            if error is None or not self.is_failure(error):
+                if self.state != CLOSED:
+                    logger.info(f"Circuit breaker for {self.name} closed")
+                self.state = CLOSED
+                self.consecutive_failures = 0
+                return
+
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"Circuit breaker for {self.name} opened after {self.consecutive_failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "total_failures": self.total_failures,
+                "rejected_calls": self.rejected_calls,
+                "retry_in_seconds": retry_in,
+            }
+
+
+class CallBreakers:
+    """The breakers a call must pass, checked and updated together."""
+    def __init__(self, *breakers: CircuitBreaker):
+        self.breakers = breakers
+
+    def before_call(self):
+        for breaker in self.breakers:
+            breaker.before_call()
+
+    def record(self, error: Optional[BaseException] = None):
+        for breaker in self.breakers:
+            breaker.record(error)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str, model: Optional[str] = None) -> CircuitBreaker:
+    """
+    The provider-wide breaker, which only counts provider failures, or with
+    `model` the breaker for that model, which counts every retryable error.
+    """
+    name = provider if model is None else f"{provider}/{model}"
+    with _breakers_lock:
+        if name not in _breakers:
+            is_failure = is_provider_failure if model is None else is_retryable
+            _breakers[name] = CircuitBreaker(name, is_failure=is_failure)
+        return _breakers[name]
+
+
+def get_call_breakers(provider: str, model: str) -> CallBreakers:
+    """
+    Breakers guarding a call to `model`: one rate-limited or failing model
+    only opens its own breaker, so other models on the provider (including
+    the judge) keep working; an unreachable provider opens them all.
+    """
+    # Model first: its trial call is the one left pending if the provider then rejects
+    return CallBreakers(get_circuit_breaker(provider, model), get_circuit_breaker(provider))
+
+
+def circuit_breaker_states() -> List[Dict[str, Any]]:
+    """State of every provider and model breaker seen so far, for metrics and the UI."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in sorted(breakers, key=lambda b: b.name)]
@@ -1,28 +1,254 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON, Float
-from sqlalchemy.orm import declarative_base, sessionmaker
+from contextlib import contextmanager
+from typing import Iterator
+from sqlalchemy import create_engine, event, inspect, text, select, func, Index, Column, Integer, String, Text, Date, DateTime, JSON, Float, Boolean
+from sqlalchemy.orm import declarative_base, sessionmaker, Session
+from sqlalchemy.engine import make_url
 from datetime import datetime
 from config.settings import settings
 
 Base = declarative_base()
 
+# SQLite FTS5 table over prompts and sample text, maintained by GenerationRepository
+SEARCH_TABLE = "search_index"
+
 class DBGeneration(Base):
     __tablename__ = "generations"
     
     id = Column(String, primary_key=True)
     prompt = Column(Text, nullable=False)
-    data_type = Column(String, nullable=False)
-    model_name = Column(String, nullable=False)
+    data_type = Column(String, nullable=False, index=True)
+    model_name = Column(String, nullable=False, index=True)
     
     # Store raw result or list of samples as JSON
     samples = Column(JSON, nullable=True) 
     
     # Validation info
-    average_score = Column(Float, default=0.0)
+    average_score = Column(Float, default=0.0, index=True)
+    pass_rate = Column(Float, nullable=True)
+    attempts = Column(Integer, default=1)
+
+    # Token accounting, used to learn per-sample completion budgets
+    schema_hash = Column(String, nullable=True)
+    num_samples = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
+    # Completion tokens of the attempts that produced the samples; billed usage above also counts retries
+    final_completion_tokens = Column(Integer, default=0)
+    truncated = Column(Boolean, default=False)
+    judge_prompt_tokens = Column(Integer, default=0)
+    judge_completion_tokens = Column(Integer, default=0)
+    # Generator and judge tokens spent on every refine attempt, not just the one that was kept
+    total_tokens = Column(Integer, default=0)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+Index("ix_generations_token_stats", DBGeneration.model_name, DBGeneration.data_type, DBGeneration.schema_hash)
+
+class DBModelHealth(Base):
+    __tablename__ = "model_health"
+
+    model_name = Column(String, primary_key=True)
+    calls = Column(Integer, default=0)
+    errors = Column(Integer, default=0)
+    latency_ms = Column(Float, nullable=True)
+    error_rate = Column(Float, default=0.0)
+    tokens_per_sec = Column(Float, nullable=True)
+    judged_samples = Column(Integer, default=0)
+    judge_pass_rate = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class DBSampleScore(Base):
+    __tablename__ = "sample_scores"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    generation_id = Column(String, nullable=False, index=True)
+    sample_index = Column(Integer, nullable=False)
+    score = Column(Integer, nullable=False)
+    passed = Column(Boolean, nullable=False)
+    comments = Column(Text, nullable=True)
+
+class _QualityStats:
+    """
+    Running totals maintained on every save, so quality and cost figures are
+    read from one row instead of scanning runs.
+    """
+    runs = Column(Integer, default=0, nullable=False)
+    samples = Column(Integer, default=0, nullable=False)
+    scored_samples = Column(Integer, default=0, nullable=False)
+    passed_samples = Column(Integer, default=0, nullable=False)
+    score_sum = Column(Float, default=0.0, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    prompt_tokens = Column(Integer, default=0, nullable=False)
+    completion_tokens = Column(Integer, default=0, nullable=False)
+    cached_tokens = Column(Integer, default=0, nullable=False)
+    judge_prompt_tokens = Column(Integer, default=0, nullable=False)
+    judge_completion_tokens = Column(Integer, default=0, nullable=False)
+    total_tokens = Column(Integer, default=0, nullable=False)
+
+    @property
+    def mean_score(self):
+        return self.score_sum / self.scored_samples if self.scored_samples else None
+
+    @property
+    def pass_rate(self):
+        return self.passed_samples / self.scored_samples if self.scored_samples else None
+
+    @property
+    def mean_attempts(self):
+        return self.attempts / self.runs if self.runs else None
 
-engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
+class DBModelStats(_QualityStats, Base):
+    __tablename__ = "model_stats"
+
+    model_name = Column(String, primary_key=True)
+
+class DBDailyStats(_QualityStats, Base):
+    __tablename__ = "daily_stats"
+
+    day = Column(Date, primary_key=True)
+    model_name = Column(String, primary_key=True)
+
+def _create_engine():
+    url = make_url(settings.DATABASE_URL)
+    kwargs = {"pool_pre_ping": True}
+    if url.get_backend_name() == "sqlite":
+        kwargs["connect_args"] = {"check_same_thread": False}
+    if url.database not in (None, "", ":memory:"):
+        # File-backed and server databases get a real connection pool
+        kwargs["pool_size"] = settings.DB_POOL_SIZE
+        kwargs["max_overflow"] = settings.DB_MAX_OVERFLOW
+    return create_engine(url, **kwargs)
+
+engine = _create_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@event.listens_for(engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    if engine.dialect.name != "sqlite":
+        return
+    # WAL lets readers proceed while another session writes; busy_timeout makes
+    # concurrent writers wait for the lock instead of failing immediately
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    Provide a request-scoped session from the pool, rolled back on error
+    and always returned to the pool afterwards.
+    """
+    session = SessionLocal()
+    try:
+        yield session
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _add_missing_columns():
+    """
+    Add columns introduced after a table was first created. create_all only
+    creates missing tables, so existing databases would otherwise lack them.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            if not column.nullable and column.default is not None and column.default.is_scalar:
+                # Existing rows need a value, e.g. aggregate counters start at zero
+                ddl += f" NOT NULL DEFAULT {column.default.arg!r}"
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+
+def search_index_available() -> bool:
+    return engine.dialect.name == "sqlite"
+
+def _init_search_index():
+    """
+    Create the FTS5 index over prompts and sample text. Rows with
+    sample_index -1 hold a run's prompt; others hold one sample each.
+    Existing runs are indexed once when the table is first created.
+    """
+    if not search_index_available():
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": SEARCH_TABLE}
+        ).first()
+        if exists:
+            return
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            "body, generation_id UNINDEXED, sample_index UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text(
+            f"INSERT INTO {SEARCH_TABLE} (body, generation_id, sample_index) "
+            "SELECT prompt, id, -1 FROM generations"
+        ))
+        conn.execute(text(
+            f"INSERT INTO {SEARCH_TABLE} (body, generation_id, sample_index) "
+            "SELECT json_extract(j.value, '$.content'), g.id, CAST(j.key AS INTEGER) "
+            "FROM generations g, json_each(g.samples) j WHERE g.samples IS NOT NULL"
+        ))
+
+def _backfill_stats(tables):
+    """
+    Seed newly created aggregate tables from existing runs. Runs saved
+    before per-sample scores were kept count towards runs and tokens only.
+    """
+    totals = [
+        func.count().label("runs"),
+        # num_samples is NULL on runs saved before it existed; count their stored samples instead
+        func.coalesce(func.sum(func.coalesce(
+            DBGeneration.num_samples, func.json_array_length(DBGeneration.samples)
+        )), 0).label("samples"),
+        func.sum(func.coalesce(DBGeneration.attempts, 1)).label("attempts"),
+        func.coalesce(func.sum(DBGeneration.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(DBGeneration.completion_tokens), 0).label("completion_tokens"),
+        func.coalesce(func.sum(DBGeneration.cached_tokens), 0).label("cached_tokens"),
+        func.coalesce(func.sum(DBGeneration.judge_prompt_tokens), 0).label("judge_prompt_tokens"),
+        func.coalesce(func.sum(DBGeneration.judge_completion_tokens), 0).label("judge_completion_tokens"),
+        func.coalesce(func.sum(func.coalesce(
+            func.nullif(DBGeneration.total_tokens, 0), DBGeneration.prompt_tokens + DBGeneration.completion_tokens
+        )), 0).label("total_tokens"),
+    ]
+    names = [
+        "runs", "samples", "attempts", "prompt_tokens", "completion_tokens", "cached_tokens",
+        "judge_prompt_tokens", "judge_completion_tokens", "total_tokens"
+    ]
+    with engine.begin() as conn:
+        if DBModelStats.__table__ in tables:
+            query = select(DBGeneration.model_name, *totals).group_by(DBGeneration.model_name)
+            conn.execute(DBModelStats.__table__.insert().from_select(["model_name", *names], query))
+        if DBDailyStats.__table__ in tables:
+            day = func.date(DBGeneration.created_at)
+            query = select(day, DBGeneration.model_name, *totals).group_by(day, DBGeneration.model_name)
+            conn.execute(DBDailyStats.__table__.insert().from_select(["day", "model_name", *names], query))
+
 def init_db():
+    _add_missing_columns()
+    inspector = inspect(engine)
+    new_stats = [
+        model.__table__ for model in (DBModelStats, DBDailyStats)
+        if not inspector.has_table(model.__tablename__)
+    ]
     Base.metadata.create_all(bind=engine)
+    if new_stats:
+        _backfill_stats(new_stats)
+    # Indexes on pre-existing tables are not created by create_all
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    _init_search_index()
@@ -1,18 +1,52 @@
+from datetime import date, datetime
+from sqlalchemy import select, func, text, table, column, literal_column, update, null
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from memory.database import DBGeneration
-from core.schemas import GenerationRequest, GenerationResult
+from memory.database import (
+    DBGeneration, DBSampleScore, DBModelStats, DBDailyStats, DBModelHealth, SEARCH_TABLE, search_index_available
+)
+from core.schemas import GenerationRequest, GenerationResult, SearchHit
+from core.token_budget import schema_fingerprint
+from llms.model_health import ModelHealth
+from typing import Any, Dict, List, Optional, Tuple
 import json
 
+search_index = table(SEARCH_TABLE, column("body"), column("generation_id"), column("sample_index"), column("rank"))
+
+def _fts_query(query: str) -> str:
+    """
+    Quote each whitespace-separated term so user input is matched literally
+    (all terms required) instead of being parsed as FTS5 query syntax.
+    A trailing '*' on a term keeps prefix matching.
+    """
+    terms = []
+    for term in query.split():
+        prefix = term.endswith("*") and len(term) > 1
+        term = term.rstrip("*") if prefix else term
+        terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
 class GenerationRepository:
     def __init__(self, db: Session):
         self.db = db
         
-    def save_result(self, request: GenerationRequest, result: GenerationResult, avg_score: float = 0.0):
-        # Convert samples to serializable format
-        samples_data = [
-            s.dict() if hasattr(s, 'dict') else s.__dict__ 
-            for s in result.samples
-        ]
+    def save_result(self, request: GenerationRequest, result: GenerationResult, avg_score: Optional[float] = None):
+        """
+        Persist a run with its per-sample judge scores, and fold it into the
+        per-model and per-day aggregates in the same transaction. The average
+        score is taken from the result's feedback unless given explicitly.
+        """
+        # Convert samples to serializable format straight from the columnar batch
+        samples_data = result.samples.to_records()
+        # Verdicts from failed judge calls are not scores of the samples
+        feedback = [(i, f) for i, f in enumerate(result.feedback) if not f.judge_error]
+        scores = [f.score for _, f in feedback]
+        passed = sum(1 for _, f in feedback if f.passed)
+        if avg_score is None and scores:
+            avg_score = sum(scores) / len(scores)
+        total_tokens = result.total_tokens or (
+            result.prompt_tokens + result.completion_tokens + result.judge_prompt_tokens + result.judge_completion_tokens
+        )
         
         db_item = DBGeneration(
             id=result.request_id,
@@ -20,13 +54,224 @@ class GenerationRepository:
             data_type=request.data_type,
             model_name=result.model_used,
             samples=samples_data,
-            average_score=avg_score,
+            # Explicit NULL: the column default of 0.0 would read as a real score
+            average_score=avg_score if avg_score is not None else null(),
+            pass_rate=passed / len(feedback) if feedback else None,
+            attempts=result.attempts,
+            schema_hash=schema_fingerprint(request.schema_def),
+            num_samples=len(samples_data),
+            prompt_tokens=result.prompt_tokens,
+            completion_tokens=result.completion_tokens,
+            cached_tokens=result.cached_tokens,
+            final_completion_tokens=result.final_completion_tokens,
+            truncated=result.truncated,
+            judge_prompt_tokens=result.judge_prompt_tokens,
+            judge_completion_tokens=result.judge_completion_tokens,
+            total_tokens=total_tokens,
             created_at=result.timestamp
         )
         self.db.add(db_item)
+        self.db.add_all(
+            DBSampleScore(generation_id=result.request_id, sample_index=i, score=f.score, passed=f.passed, comments=f.comments)
+            for i, f in feedback
+        )
+        totals = {
+            "runs": 1,
+            "samples": len(samples_data),
+            "scored_samples": len(scores),
+            "passed_samples": passed,
+            "score_sum": float(sum(scores)),
+            "attempts": result.attempts,
+            "prompt_tokens": result.prompt_tokens,
+            "completion_tokens": result.completion_tokens,
+            "cached_tokens": result.cached_tokens,
+            "judge_prompt_tokens": result.judge_prompt_tokens,
+            "judge_completion_tokens": result.judge_completion_tokens,
+            "total_tokens": total_tokens,
+        }
+        self._bump_stats(DBModelStats, {"model_name": result.model_used}, totals)
+        self._bump_stats(DBDailyStats, {"day": result.timestamp.date(), "model_name": result.model_used}, totals)
+        self._index_for_search(result.request_id, request.prompt, result)
         self.db.commit()
         self.db.refresh(db_item)
         return db_item
         
+    def _bump_stats(self, model, key: Dict[str, Any], totals: Dict[str, Any]):
+        """Add `totals` to the aggregate row for `key`, creating it if needed."""
+        dialect = self.db.get_bind().dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            stmt = insert(model).values(**key, **totals)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(key),
+                set_={name: getattr(model, name) + stmt.excluded[name] for name in totals}
+            )
+            self.db.execute(stmt)
+            return
+
+        updated = self.db.execute(
+            update(model)
+            .where(*(getattr(model, k) == v for k, v in key.items()))
+            .values({name: getattr(model, name) + value for name, value in totals.items()})
+        )
+        if updated.rowcount == 0:
+            self.db.add(model(**key, **totals))
+
+    def _index_for_search(self, generation_id: str, prompt: str, result: GenerationResult):
+        # Written in the same transaction as the run, so the index never drifts
+        if not search_index_available():
+            return
+        rows = [{"body": prompt, "generation_id": generation_id, "sample_index": -1}]
+        rows.extend(
+            {"body": body, "generation_id": generation_id, "sample_index": i}
+            for i, body in enumerate(result.samples.iter_json())
+        )
+        self.db.execute(
+            text(f"INSERT INTO {SEARCH_TABLE} (body, generation_id, sample_index) VALUES (:body, :generation_id, :sample_index)"),
+            rows
+        )
+
     def get_history(self, limit: int = 50):
         return self.db.query(DBGeneration).order_by(DBGeneration.created_at.desc()).limit(limit).all()
+
+    def get_run_samples(self, generation_ids: List[str]) -> List[Tuple[str, List[Any]]]:
+        """(generation id, sample contents) for each id, in the order given."""
+        rows = {
+            row.id: row
+            for row in self.db.query(DBGeneration).filter(DBGeneration.id.in_(generation_ids)).all()
+        }
+        missing = [gid for gid in generation_ids if gid not in rows]
+        if missing:
+            raise ValueError(f"Unknown generation ids: {', '.join(missing)}")
+        return [(gid, [s["content"] for s in rows[gid].samples or []]) for gid in generation_ids]
+
+    def get_model_stats(self) -> List[DBModelStats]:
+        return self.db.query(DBModelStats).order_by(DBModelStats.model_name).all()
+
+    def get_daily_stats(self,
+                        model_name: Optional[str] = None,
+                        date_from: Optional[date] = None,
+                        date_to: Optional[date] = None,
+                        limit: int = 90) -> List[DBDailyStats]:
+        query = self.db.query(DBDailyStats)
+        if model_name:
+            query = query.filter(DBDailyStats.model_name == model_name)
+        if date_from is not None:
+            query = query.filter(DBDailyStats.day >= date_from)
+        if date_to is not None:
+            query = query.filter(DBDailyStats.day <= date_to)
+        return query.order_by(DBDailyStats.day.desc(), DBDailyStats.model_name).limit(limit).all()
+
+    def get_model_health(self) -> List[ModelHealth]:
+        return [
+            ModelHealth(
+                model_name=row.model_name,
+                calls=row.calls or 0,
+                errors=row.errors or 0,
+                latency_ms=row.latency_ms,
+                error_rate=row.error_rate or 0.0,
+                tokens_per_sec=row.tokens_per_sec,
+                judged_samples=row.judged_samples or 0,
+                judge_pass_rate=row.judge_pass_rate,
+                updated_at=row.updated_at
+            )
+            for row in self.db.query(DBModelHealth).all()
+        ]
+
+    def save_model_health(self, health: List[ModelHealth]):
+        for item in health:
+            self.db.merge(DBModelHealth(**item.model_dump()))
+        self.db.commit()
+
+    def search(self,
+               query: str,
+               model_name: Optional[str] = None,
+               data_type: Optional[str] = None,
+               min_score: Optional[float] = None,
+               max_score: Optional[float] = None,
+               date_from: Optional[datetime] = None,
+               date_to: Optional[datetime] = None,
+               limit: int = 50) -> List[SearchHit]:
+        """
+        Full-text search over prompts and sample text, best matches first,
+        optionally filtered by run metadata.
+        """
+        filters = []
+        if model_name:
+            filters.append(DBGeneration.model_name == model_name)
+        if data_type:
+            filters.append(DBGeneration.data_type == data_type)
+        if min_score is not None:
+            filters.append(DBGeneration.average_score >= min_score)
+        if max_score is not None:
+            filters.append(DBGeneration.average_score <= max_score)
+        if date_from is not None:
+            filters.append(DBGeneration.created_at >= date_from)
+        if date_to is not None:
+            filters.append(DBGeneration.created_at <= date_to)
+
+        meta = (DBGeneration.id, DBGeneration.prompt, DBGeneration.model_name,
+                DBGeneration.data_type, DBGeneration.average_score, DBGeneration.created_at)
+
+        if not search_index_available():
+            # No FTS outside SQLite: fall back to a prompt substring scan
+            stmt = (
+                select(*meta)
+                .where(DBGeneration.prompt.ilike(f"%{query}%"), *filters)
+                .order_by(DBGeneration.created_at.desc())
+                .limit(limit)
+            )
+            return [
+                SearchHit(generation_id=r.id, snippet=r.prompt, prompt=r.prompt, model_name=r.model_name,
+                          data_type=r.data_type, average_score=r.average_score, created_at=r.created_at)
+                for r in self.db.execute(stmt)
+            ]
+
+        fts = literal_column(SEARCH_TABLE)
+        stmt = (
+            select(
+                search_index.c.sample_index,
+                func.snippet(fts, 0, "[", "]", "…", 16).label("snippet"),
+                *meta
+            )
+            .select_from(search_index.join(DBGeneration, DBGeneration.id == search_index.c.generation_id))
+            .where(fts.op("MATCH")(_fts_query(query)), *filters)
+            .order_by(search_index.c.rank)
+            .limit(limit)
+        )
+        return [
+            SearchHit(
+                generation_id=r.id,
+                sample_index=None if r.sample_index < 0 else r.sample_index,
+                snippet=r.snippet,
+                prompt=r.prompt,
+                model_name=r.model_name,
+                data_type=r.data_type,
+                average_score=r.average_score,
+                created_at=r.created_at,
+            )
+            for r in self.db.execute(stmt)
+        ]
+
+        
+    def get_token_stats(self, model_name: str, data_type: str, schema_hash: str, limit: int = 20) -> Tuple[int, int]:
+        """
+        Return (completion_tokens, samples) summed over the most recent
+        untruncated runs for a model, data type and schema. Only the final
+        attempt of each call counts, so truncated retries do not inflate it.
+        """
+        rows = (
+            self.db.query(DBGeneration.final_completion_tokens, DBGeneration.num_samples)
+            .filter(
+                DBGeneration.model_name == model_name,
+                DBGeneration.data_type == data_type,
+                DBGeneration.schema_hash == schema_hash,
+                DBGeneration.truncated.is_(False),
+                DBGeneration.final_completion_tokens > 0,
+                DBGeneration.num_samples > 0,
+            )
+            .order_by(DBGeneration.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+        return sum(r[0] for r in rows), sum(r[1] for r in rows)
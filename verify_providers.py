@@ -12,7 +12,7 @@ async def test_provider(model_id, model_name):
     try:
         client = get_llm_client(model_id)
         # Simple hello world
-        response = client.generate(
+        response = await client.agenerate(
             messages=[{"role": "user", "content": "Say 'Health Check Passed' and nothing else."}],
             max_tokens=20
         )